@@ -1,34 +1,182 @@
-import asyncio
+import hmac
 import logging
 import os
-from datetime import datetime, timezone
-from typing import Any, MutableMapping
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, AsyncIterator
 
-from aiohttp import ClientSession
-from aiohttp.web import Application, Request, Response, run_app
-from cachetools import LRUCache
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.web import Application, Request, Response, json_response, run_app
 from gidgethub.sansio import Event
 from sentry_sdk import init as sentry_init
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 
-from bellshadebot.api import GitHubAPI
-from bellshadebot.event import main_router
+from bellshadebot.api import token_cache
+from bellshadebot.cache import create_response_cache
+from bellshadebot.event.check_run import check_run_aggregator
+from bellshadebot.index import pr_index
+from bellshadebot.jobqueue import JobQueue
+from bellshadebot.logs import setup_logging
+from bellshadebot.metrics import CONTENT_TYPE, registry
+from bellshadebot.parser.cache import lint_cache
+from bellshadebot.parser.executor import LINT_WORKERS, lint_executor
+from bellshadebot.parser.registry import get_rule_registry
+from bellshadebot.ratelimit import scheduler
+from bellshadebot.scheduler import backoff, task_scheduler
+from bellshadebot.tracing import TRACE_SENTRY, tracer
+from bellshadebot.worker import EventWorkerPool
 
-cache: MutableMapping[Any, Any] = LRUCache(maxsize=500)
+cache = create_response_cache()
+
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", "30"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", "300"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# bukan WEB_CONCURRENCY: buildpack Heroku mengisinya otomatis, sedangkan urutan per
+# PR, debounce check run dan pembatalan review hanya berlaku di dalam satu proses
+BELLSHADEBOT_PROCESSES = int(os.environ.get("BELLSHADEBOT_PROCESSES", "1"))
+# state berikut masih per proses, lihat README bagian "Proses"
+BELLSHADEBOT_PROCESSES_UNSAFE = (
+    os.environ.get("BELLSHADEBOT_PROCESSES_UNSAFE", "0") == "1"
+)
+SUPERVISOR_BACKOFF_BASE = float(os.environ.get("SUPERVISOR_BACKOFF_BASE", "1"))
+SUPERVISOR_BACKOFF_CAP = float(os.environ.get("SUPERVISOR_BACKOFF_CAP", "60"))
+SUPERVISOR_HEALTHY_AFTER = float(os.environ.get("SUPERVISOR_HEALTHY_AFTER", "60"))
+SUPERVISOR_POLL_INTERVAL: float = 0.5
+WEB_REUSE_PORT = os.environ.get("WEB_REUSE_PORT", "").lower() in ("1", "true", "yes")
+USE_UVLOOP = os.environ.get("USE_UVLOOP", "").lower() in ("1", "true", "yes")
 
 sentry_init(
     dsn=os.environ.get("SENTRY_DSN"),
     integrations=[AioHttpIntegration(transaction_style="method_and_path_pattern")],
+    # sampling trace ditentukan oleh tracer, transaction HTTP lain tidak dikirim
+    traces_sample_rate=0.0 if TRACE_SENTRY else None,
 )
 
-logging.basicConfig(
-    format="[%(levelname)s] %(message)s",
-    level=os.environ.get("LOG_LEVEL", "INFO"),
-    handlers=[logging.StreamHandler()],
-)
+setup_logging()
 
 logger = logging.getLogger(__package__)
 
+CACHE_LOOKUPS = registry.counter(
+    "bellshadebot_cache_lookups_total",
+    "Lookup cache token, ETag response, hasil lint dan index PR",
+    ("cache", "result"),
+    collect=lambda: {
+        ("token", "hit"): token_cache.hits,
+        ("token", "miss"): token_cache.misses,
+        ("response", "hit"): cache.hits,
+        ("response", "miss"): cache.misses,
+        ("response", "revalidated"): cache.revalidations,
+        ("lint", "hit"): lint_cache.hits,
+        ("lint", "miss"): lint_cache.misses,
+        ("pr_index", "hit"): pr_index.hits,
+        ("pr_index", "miss"): pr_index.misses,
+    },
+)
+CACHE_HIT_RATIO = registry.gauge(
+    "bellshadebot_cache_hit_ratio",
+    "Rasio hit cache sejak proses berjalan",
+    ("cache",),
+    collect=lambda: {
+        (name,): hits / (hits + misses) if hits + misses else None
+        for name, hits, misses in (
+            ("token", token_cache.hits, token_cache.misses),
+            ("response", cache.hits, cache.misses),
+            ("lint", lint_cache.hits, lint_cache.misses),
+            ("pr_index", pr_index.hits, pr_index.misses),
+        )
+    },
+)
+RATELIMIT_REMAINING = registry.gauge(
+    "bellshadebot_ratelimit_remaining",
+    "Sisa budget rate limit GitHub per installation dan resource",
+    ("installation", "resource"),
+    collect=lambda: {
+        (str(installation_id), resource): budget["remaining"]
+        for (installation_id, resource), budget in scheduler.metrics().items()
+    },
+)
+RATELIMIT_LIMIT = registry.gauge(
+    "bellshadebot_ratelimit_limit",
+    "Limit rate limit GitHub per installation dan resource",
+    ("installation", "resource"),
+    collect=lambda: {
+        (str(installation_id), resource): budget["limit"]
+        for (installation_id, resource), budget in scheduler.metrics().items()
+    },
+)
+RATELIMIT_RESET = registry.gauge(
+    "bellshadebot_ratelimit_reset_seconds",
+    "Sisa waktu sampai rate limit GitHub direset",
+    ("installation", "resource"),
+    collect=lambda: {
+        (str(installation_id), resource): budget["reset_in"]
+        for (installation_id, resource), budget in scheduler.metrics().items()
+    },
+)
+RATELIMIT_DEFERRED = registry.gauge(
+    "bellshadebot_ratelimit_deferred",
+    "Request yang sedang ditunda oleh rate limit scheduler",
+    ("installation", "resource"),
+    collect=lambda: {
+        (str(installation_id), resource): budget["deferred"]
+        for (installation_id, resource), budget in scheduler.metrics().items()
+    },
+)
+QUEUE_DEPTH = registry.gauge(
+    "bellshadebot_queue_depth", "Event yang menunggu di worker pool proses ini"
+)
+JOBS = registry.gauge("bellshadebot_jobs", "Job di queue SQLite per state", ("state",))
+DEAD_LETTER = registry.gauge(
+    "bellshadebot_dead_letter_jobs", "Job di tabel dead letter"
+)
+OLDEST_JOB_AGE = registry.gauge(
+    "bellshadebot_oldest_job_age_seconds", "Umur job tertua di queue SQLite"
+)
+
+
+async def client_session_ctx(app: Application) -> AsyncIterator[None]:
+    connector = TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    async with ClientSession(connector=connector) as session:
+        app["client_session"] = session
+        yield
+        token_cache.close()
+
+
+async def lint_executor_ctx(app: Application) -> AsyncIterator[None]:
+    get_rule_registry()
+    lint_executor.start()
+    yield
+    lint_executor.shutdown()
+
+
+async def job_queue_ctx(app: Application) -> AsyncIterator[None]:
+    jobs = JobQueue()
+    app["job_queue"] = jobs
+    check_run_aggregator.jobs = jobs
+    yield
+    check_run_aggregator.jobs = None
+    await jobs.close()
+
+
+async def worker_pool_ctx(app: Application) -> AsyncIterator[None]:
+    pool = EventWorkerPool(app["client_session"], cache=cache, jobs=app["job_queue"])
+    pool.start()
+    app["worker_pool"] = pool
+    yield
+    await pool.stop()
+    await task_scheduler.close()
+    tracer.close()
+
 
 async def main(request: Request) -> Response:
     try:
@@ -42,29 +190,154 @@ async def main(request: Request) -> Response:
             f"{event.event}:{event.data['action']}",
             event.delivery_id,
         )
-        async with ClientSession() as session:
-            gh = GitHubAPI(
-                event.data["installation"]["id"],
-                session,
-                "arfyslowy/bellshadebot",
-                cache=cache,
-            )
-            await asyncio.sleep(1)
-            await main_router.dispatch(event, gh)
-
-        if gh.rate_limit is not None:  # pragma: no cover
-            logger.info(
-                "ratelimit=%s, time_remaining=%s",
-                f"{gh.rate_limit.remaining}/{gh.rate_limit.limit}",
-                gh.rate_limit.reset_datetime - datetime.now(timezone.utc),
-            )
-        return Response(status=200)
+        jobs: JobQueue = request.app["job_queue"]
+        job_id = await jobs.enqueue(event)
+        if job_id is None:
+            logger.info("event duplikat: delivery_id=%s", event.delivery_id)
+        elif not request.app["worker_pool"].submit(event, job_id):
+            await jobs.release(job_id)
+        return Response(status=202)
     except Exception as err:
         logger.exception(err)
         return Response(status=500, text=str(err))
 
 
-if __name__ == "__main__":
+def is_admin(request: Request) -> bool:
+    authorization = request.headers.get("Authorization", "")
+    return ADMIN_TOKEN is not None and hmac.compare_digest(
+        authorization, f"Bearer {ADMIN_TOKEN}"
+    )
+
+
+async def admin_queue(request: Request) -> Response:
+    if not is_admin(request):
+        return Response(status=404)
+
+    stats = await request.app["job_queue"].stats()
+    stats["in_memory"] = request.app["worker_pool"].queue_depth
+    return json_response(stats)
+
+
+async def metrics(request: Request) -> Response:
+    if not is_admin(request):
+        return Response(status=404)
+
+    stats = await request.app["job_queue"].stats()
+    for state, count in stats["jobs"].items():
+        JOBS.set(state, value=count)
+    DEAD_LETTER.set(value=stats["dead_letter"])
+    OLDEST_JOB_AGE.set(value=stats["oldest_age"])
+    QUEUE_DEPTH.set(value=request.app["worker_pool"].queue_depth)
+    return Response(
+        body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+    )
+
+
+def create_app() -> Application:
     app = Application()
+    app.cleanup_ctx.append(client_session_ctx)
+    app.cleanup_ctx.append(lint_executor_ctx)
+    app.cleanup_ctx.append(job_queue_ctx)
+    app.cleanup_ctx.append(worker_pool_ctx)
     app.router.add_post("/", main)
-    run_app(app, port=int(os.environ.get("PORT", "5000")))
+    app.router.add_get("/admin/queue", admin_queue)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def serve(port: int, reuse_port: bool = False) -> None:
+    if USE_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop tidak terinstall, memakai event loop asyncio")
+        else:
+            uvloop.install()
+    run_app(create_app(), port=port, reuse_port=reuse_port)
+
+
+def supervise(port: int, processes: int) -> None:
+    # cache ETag, lint dan index dibagi antar proses lewat SQLite, state lain belum
+    if not BELLSHADEBOT_PROCESSES_UNSAFE:
+        sys.exit(
+            "BELLSHADEBOT_PROCESSES>1 belum aman: urutan event per PR, pembatalan"
+            " review yang tergantikan, debounce check run dan hitungan PR terbuka"
+            " masih per proses. isi BELLSHADEBOT_PROCESSES_UNSAFE=1 untuk tetap"
+            " menjalankannya"
+        )
+    logger.warning(
+        "%s proses tanpa state bersama: urutan event per PR, pembatalan review,"
+        " debounce check run dan hitungan PR terbuka tidak dijamin",
+        processes,
+    )
+    env = {
+        **os.environ,
+        "BELLSHADEBOT_PROCESSES": "1",
+        "WEB_REUSE_PORT": "1",
+        # pool lint dibagi supaya total proses lint tetap sekitar jumlah CPU
+        "LINT_WORKERS": str(min(LINT_WORKERS, max(LINT_WORKERS // processes, 1))),
+    }
+    env.setdefault("STATE_DB_PATH", "bellshadebot.db")
+    children: dict[int, int] = {}
+    started_at: dict[int, float] = {}
+    failures: dict[int, int] = {}
+    restarts: dict[int, float] = {}
+    stopping = False
+
+    def start(index: int) -> None:
+        process = subprocess.Popen(
+            [sys.executable, "-m", __package__],
+            env={**env, "BELLSHADEBOT_PROCESS_INDEX": str(index)},
+        )
+        children[process.pid] = index
+        started_at[index] = time.monotonic()
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(processes):
+        start(index)
+    logger.info("%s proses web berjalan di port %s", processes, port)
+
+    while children or (restarts and not stopping):
+        pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+        if pid == 0:
+            now = time.monotonic()
+            for index, restart_at in list(restarts.items()):
+                if restart_at <= now and not stopping:
+                    del restarts[index]
+                    start(index)
+            time.sleep(SUPERVISOR_POLL_INTERVAL)
+            continue
+
+        index = children.pop(pid, -1)
+        if index < 0 or stopping:
+            continue
+        now = time.monotonic()
+        if now - started_at[index] >= SUPERVISOR_HEALTHY_AFTER:
+            failures[index] = 0
+        # proses yang langsung mati saat start dijalankan ulang dengan backoff
+        delay = backoff(
+            failures.get(index, 0), SUPERVISOR_BACKOFF_BASE, SUPERVISOR_BACKOFF_CAP
+        )
+        failures[index] = failures.get(index, 0) + 1
+        restarts[index] = now + delay
+        logger.error(
+            "web.%s berhenti (exitcode=%s), dijalankan ulang dalam %.1fs",
+            index,
+            os.waitstatus_to_exitcode(status),
+            delay,
+        )
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", "5000"))
+    if BELLSHADEBOT_PROCESSES > 1:
+        supervise(port, BELLSHADEBOT_PROCESSES)
+    else:
+        serve(port, WEB_REUSE_PORT)
@@ -1,23 +1,170 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
-from typing import Any, Mapping, MutableMapping, Optional
+import time
+from contextvars import Context, ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Mapping, Optional
 
 from aiohttp import ClientResponse
-from cachetools import TTLCache
-from gidgethub import apps
-from gidgethub.abc import UTF_8_CHARSET
+from gidgethub import apps, sansio
+from gidgethub.abc import JSON_CONTENT_TYPE
 from gidgethub.aiohttp import GitHubAPI as BaseGitHubAPI
+from uritemplate import variable
+
+from bellshadebot.cache import ResponseCache
+from bellshadebot.labels import LabelReconciler
+from bellshadebot.logs import body_excerpt, route_level, sample_body
+from bellshadebot.metrics import (
+    GITHUB_REQUEST_DURATION,
+    GITHUB_REQUESTS,
+    route_template,
+)
+from bellshadebot.ratelimit import RATELIMIT_RETRIES, classify, resource, scheduler
+from bellshadebot.tracing import KIND_CLIENT, tracer
 
-token_cache: MutableMapping[int, str] = TTLCache(maxsize=100, ttl=1 * 59 * 60)
 STATUS_OK: tuple[int, int, int, int] = (200, 201, 204, 304)
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_EXPIRY_LEEWAY: float = 60
+JWT_TTL: float = 10 * 60
+JWT_REFRESH_MARGIN: float = 60
 logger = logging.getLogger(__package__)
 
+RequestKey = tuple[str, str, Optional[str]]
+Result = tuple[Any, Optional[str]]
+# hasil request beserta header dan rate limit-nya, disalin ke tiap pemanggil
+Fetched = tuple[Result, Optional[Mapping[str, Any]], Optional[sansio.RateLimit]]
+_inflight: dict[RequestKey, asyncio.Future[Fetched]] = {}
+# token graphql per pemanggilan, instance GitHubAPI dipakai bersama banyak handler
+_graphql_token: ContextVar[Optional[str]] = ContextVar(
+    "bellshadebot_graphql_token", default=None
+)
+
+
+@dataclass(frozen=True)
+class InstallationToken:
+    token: str
+    expires_at: float
+
+
+class InstallationTokenCache:
+    def __init__(self) -> None:
+        self._tokens: dict[int, InstallationToken] = {}
+        self._pending: dict[int, asyncio.Future[InstallationToken]] = {}
+        self._refresh: dict[int, asyncio.TimerHandle] = {}
+        self._last_used: dict[int, float] = {}
+        self._jwt: Optional[tuple[str, float]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def jwt(self) -> str:
+        now = time.time()
+        if self._jwt is None or self._jwt[1] - JWT_REFRESH_MARGIN <= now:
+            self._jwt = (
+                apps.get_jwt(
+                    app_id=os.environ["bellshade testing github app id"],
+                    private_key=os.environ["bellshade testing privatekey"],
+                ),
+                now + JWT_TTL,
+            )
+        return self._jwt[0]
+
+    async def get(self, gh: GitHubAPI, installation_id: int) -> str:
+        now = time.time()
+        self._last_used[installation_id] = now
+        token = self._tokens.get(installation_id)
+        if token is None or token.expires_at - TOKEN_EXPIRY_LEEWAY <= now:
+            self.misses += 1
+            token = await self._mint(gh, installation_id)
+        else:
+            self.hits += 1
+        return token.token
+
+    def close(self) -> None:
+        for handle in self._refresh.values():
+            handle.cancel()
+        self._refresh.clear()
+
+    async def _mint(self, gh: GitHubAPI, installation_id: int) -> InstallationToken:
+        pending = self._pending.get(installation_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._request_token(gh, installation_id))
+            self._pending[installation_id] = pending
+            pending.add_done_callback(
+                lambda _: self._pending.pop(installation_id, None)
+            )
+        return await asyncio.shield(pending)
+
+    async def _request_token(
+        self, gh: GitHubAPI, installation_id: int
+    ) -> InstallationToken:
+        data = await gh.post(
+            f"/app/installations/{installation_id}/access_tokens",
+            data=b"",
+            jwt=self.jwt(),
+        )
+        if "expires_at" in data:
+            expires_at = (
+                datetime.strptime(data["expires_at"], "%Y-%m-%dT%H:%M:%SZ")
+                .replace(tzinfo=timezone.utc)
+                .timestamp()
+            )
+        else:
+            expires_at = time.time() + 60 * 60
+        token = self._tokens[installation_id] = InstallationToken(
+            data["token"], expires_at
+        )
+        self._schedule_refresh(gh, installation_id, token)
+        return token
+
+    def _schedule_refresh(
+        self, gh: GitHubAPI, installation_id: int, token: InstallationToken
+    ) -> None:
+        if (handle := self._refresh.pop(installation_id, None)) is not None:
+            handle.cancel()
+        delay = max(token.expires_at - TOKEN_REFRESH_MARGIN - time.time(), 0.0)
+        # clone supaya timer tidak menahan _memo milik delivery yang membuat token
+        self._refresh[installation_id] = asyncio.get_running_loop().call_later(
+            delay,
+            self._refresh_token,
+            gh.clone(),
+            installation_id,
+            time.time(),
+            context=Context(),
+        )
+
+    def _refresh_token(
+        self, gh: GitHubAPI, installation_id: int, issued_at: float
+    ) -> None:
+        self._refresh.pop(installation_id, None)
+        # installation yang tidak dipakai sejak token dibuat tidak diperbarui
+        if self._last_used.get(installation_id, 0.0) < issued_at:
+            return None
+
+        def log_failure(task: asyncio.Future[InstallationToken]) -> None:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(
+                    "gagal memperbarui token installation=%s: %s",
+                    installation_id,
+                    task.exception(),
+                )
+
+        task = asyncio.ensure_future(self._mint(gh, installation_id))
+        task.add_done_callback(log_failure)
+
+
+token_cache = InstallationTokenCache()
+
 
 class GitHubAPI(BaseGitHubAPI):
     def __init__(self, installation_id: int, *args: Any, **kwargs: Any) -> None:
         self.installation_id = installation_id
+        self.labels = LabelReconciler()
+        self.deduplicated = 0
+        self._memo: dict[RequestKey, Fetched] = {}
         super().__init__(*args, **kwargs)
 
     @property
@@ -29,47 +176,179 @@ class GitHubAPI(BaseGitHubAPI):
 
     @property
     async def access_token(self) -> str:
-        installation_id = self._installation_id
-        if installation_id not in token_cache:
-            data = await apps.get_installation_access_token(
-                self,
-                installation_id=str(installation_id),
-                app_id=os.environ("bellshade testing github app id"),
-                private_key=os.environ["bellshade testing privatekey"],
+        return await token_cache.get(self, self.installation_id)
+
+    async def graphql(
+        self, query: str, *, oauth_token: Optional[str] = None, **kwargs: Any
+    ) -> Any:
+        token = _graphql_token.set(oauth_token or await self.access_token)
+        try:
+            return await super().graphql(query, **kwargs)
+        finally:
+            _graphql_token.reset(token)
+
+    def clone(self) -> GitHubAPI:
+        return type(self)(
+            self.installation_id,
+            self._session,
+            self.requester,
+            cache=self._cache,
+            base_url=self.base_url,
+        )
+
+    def forget(self, url: str) -> None:
+        filled_url = sansio.format_url(url, {}, base_url=self.base_url)
+        for key in [key for key in self._memo if key[0] == filled_url]:
+            del self._memo[key]
+
+    async def _make_request(
+        self,
+        method: str,
+        url: str,
+        url_vars: Optional[variable.VariableValueDict],
+        data: Any,
+        accept: str,
+        jwt: Optional[str] = None,
+        oauth_token: Optional[str] = None,
+        content_type: str = JSON_CONTENT_TYPE,
+    ) -> Result:
+        if method != "GET":
+            self._memo.clear()
+            return await super()._make_request(
+                method, url, url_vars, data, accept, jwt, oauth_token, content_type
             )
-            token_cache[installation_id] = data["token"]
-        return token_cache[installation_id]
+
+        key = (
+            sansio.format_url(url, url_vars, base_url=self.base_url),
+            accept,
+            jwt or oauth_token,
+        )
+        fetched = self._memo.get(key)
+        if fetched is not None:
+            self.deduplicated += 1
+        else:
+            pending = _inflight.get(key)
+            if pending is None:
+                pending = _inflight[key] = asyncio.ensure_future(
+                    self._fetch(
+                        method,
+                        url,
+                        url_vars,
+                        data,
+                        accept,
+                        jwt,
+                        oauth_token,
+                        content_type,
+                    )
+                )
+                pending.add_done_callback(lambda _: _inflight.pop(key, None))
+            else:
+                self.deduplicated += 1
+            self._memo[key] = fetched = await asyncio.shield(pending)
+
+        result, headers, rate_limit = fetched
+        if headers is not None:
+            self._headers = headers
+        if rate_limit is not None:
+            self.rate_limit = rate_limit
+        return result
+
+    async def _fetch(
+        self,
+        method: str,
+        url: str,
+        url_vars: Optional[variable.VariableValueDict],
+        data: Any,
+        accept: str,
+        jwt: Optional[str],
+        oauth_token: Optional[str],
+        content_type: str,
+    ) -> Fetched:
+        result = await super()._make_request(
+            method, url, url_vars, data, accept, jwt, oauth_token, content_type
+        )
+        return result, self.headers, self.rate_limit
 
     async def _request(
         self, method: str, url: str, headers: Mapping[str, str], body: bytes = b""
     ) -> tuple[int, Mapping[str, str], bytes]:
-        async with self._session.request(
-            method, url, headers=headers, data=body
-        ) as response:
-            self.log(response, body)
-            self._headers = response.headers
-            return response.status, response.headers, await response.read()
+        if (oauth_token := _graphql_token.get()) is not None:
+            headers = {**headers, "authorization": f"token {oauth_token}"}
+        priority = classify(method, url)
+        budget = resource(url)
+        route = route_template(url)
+        attempt = 0
+        while True:
+            # waktu tunggu rate limit dicatat terpisah dari latency GitHub
+            with tracer.span("ratelimit.acquire", priority=priority.name):
+                await scheduler.acquire(self.installation_id, priority, budget)
+            with tracer.span(
+                f"{method} {route}",
+                {"http.method": method, "http.route": route, "http.attempt": attempt},
+                kind=KIND_CLIENT,
+            ) as span:
+                start = time.perf_counter()
+                async with self._session.request(
+                    method, url, headers=headers, data=body
+                ) as response:
+                    GITHUB_REQUEST_DURATION.observe(
+                        time.perf_counter() - start, method, route
+                    )
+                    GITHUB_REQUESTS.inc(method, route, str(response.status))
+                    if span is not None:
+                        span.set(**{"http.status_code": response.status})
+                    data = await response.read()
+                    self.log(response, body, data)
+                    self._headers = response.headers
+                    if response.status == 304 and isinstance(
+                        self._cache, ResponseCache
+                    ):
+                        self._cache.record_revalidation()
+                    retry_after = scheduler.update(
+                        self.installation_id,
+                        response.status,
+                        response.headers,
+                        data,
+                        budget,
+                    )
+                    if retry_after is None or attempt >= RATELIMIT_RETRIES:
+                        return response.status, response.headers, data
+            attempt += 1
 
     @staticmethod
-    def log(response: ClientResponse, body: bytes) -> None:
-        if response.status in STATUS_OK:
-            loggerlevel = logger.info
+    def log(response: ClientResponse, body: bytes, response_body: bytes) -> None:
+        route = route_template(str(response.url))
+        ok = response.status in STATUS_OK
+        if ok:
+            level = route_level(response.method, route, logging.INFO)
+        else:
+            level = logging.ERROR
+        # body tidak di-decode kalau level route ini tidak dicatat
+        if not logger.isEnabledFor(level):
+            return None
 
-            if response.url.name in ("comments", "reviews"):
-                data = response.url.name.upper()
-            else:
-                data = body.decode(UTF_8_CHARSET)
+        if ok and response.url.name in ("comments", "reviews"):
+            data: Optional[str] = response.url.name.upper()
         else:
-            loggerlevel = logger.error
+            data = body_excerpt(body, sampled=not ok or sample_body())
 
         version = response.version
-        if version is not None:
-            version = f"{version.major}.{version.minor}"
-        loggerlevel(
-            'api "%s %s %s %s" => %s',
-            response.method,
-            response.url.raw_path_qs,
-            f"{response.url.scheme.upper()}/{version}",
-            data,
-            f"{response.status}:{response.reason}",
+        proto = f"{version.major}.{version.minor}" if version is not None else "?"
+        logger.log(
+            level,
+            "api",
+            extra={
+                "fields": {
+                    "method": response.method,
+                    "path": response.url.raw_path_qs,
+                    "route": route,
+                    "proto": f"{response.url.scheme.upper()}/{proto}",
+                    "status": response.status,
+                    "reason": response.reason,
+                    "body_bytes": len(body),
+                    "body": data,
+                    # pesan error dari GitHub, hanya untuk response gagal
+                    "response": None if ok else body_excerpt(response_body),
+                }
+            },
         )
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+import pickle
+from typing import Any, Iterator, MutableMapping
+
+from cachetools import LRUCache
+
+from bellshadebot.store import SqliteStore, open_store
+
+GITHUB_CACHE_MAX_BYTES = int(os.environ.get("GITHUB_CACHE_MAX_BYTES", str(64 * 2**20)))
+EVICT_EVERY: int = 64
+
+
+def entry_size(value: Any) -> int:
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ResponseCache(MutableMapping[str, Any]):
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+
+    def record_revalidation(self) -> None:
+        self.revalidations += 1
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "revalidation_rate": self.revalidations / self.hits if self.hits else 0.0,
+        }
+
+    def _lookup(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            value = self._lookup(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+
+class MemoryResponseCache(ResponseCache):
+    def __init__(self, max_bytes: int = GITHUB_CACHE_MAX_BYTES) -> None:
+        self._cache: LRUCache[str, Any] = LRUCache(
+            maxsize=max_bytes, getsizeof=entry_size
+        )
+
+    def _lookup(self, key: str) -> Any:
+        return self._cache[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        try:
+            self._cache[key] = value
+        except ValueError:
+            pass
+
+    def __delitem__(self, key: str) -> None:
+        del self._cache[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._cache)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class SqliteResponseCache(ResponseCache):
+    def __init__(
+        self, store: SqliteStore, max_bytes: int = GITHUB_CACHE_MAX_BYTES
+    ) -> None:
+        self._store = store
+        self._max_bytes = max_bytes
+        self._writes = 0
+
+    def _lookup(self, key: str) -> Any:
+        value = self._store.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._store.set(key, value)
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self._store.evict(self._max_bytes)
+
+    def __delitem__(self, key: str) -> None:
+        self._store.delete(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, _ in self._store.items())
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+
+def create_response_cache() -> ResponseCache:
+    store = open_store("github_cache")
+    if store is None:
+        return MemoryResponseCache()
+    return SqliteResponseCache(store)
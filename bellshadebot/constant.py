@@ -40,6 +40,13 @@ INVALID_EXTENSION_COMMENT = """\
         (https://github.com/bellshade/Python/blob/main/CONTRIBUTING.md)
     """
 
+MAX_PR_REACHED_COMMENT = """\
+    # close pull request karena batas pull request tercapai
+    @{user_login}, pull request di close karena batas pull request terbuka tercapai
+    pull request kamu yang masih terbuka: {pr_number}
+    silahkan selesaikan pull request tersebut terlebih dahulu
+    """
+
 PR_REVIEW_BODY = """\
     <details>
     <summary><b><em>lihat link yang relevan dibawah ini :arrow_down:</em></b></summary>
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional, TypeVar
+
+from gidgethub.routing import Router
+from gidgethub.sansio import Event
+
+from bellshadebot.metrics import HANDLER_DURATION, HANDLER_ERRORS
+from bellshadebot.tracing import tracer
+
+Handler = Callable[..., Awaitable[None]]
+Recheck = Callable[[], Awaitable[bool]]
+HandlerT = TypeVar("HandlerT", bound=Handler)
+
+logger = logging.getLogger(__package__)
+
+
+def runs_after(*handlers: Handler) -> Callable[[HandlerT], HandlerT]:
+    def decorator(func: HandlerT) -> HandlerT:
+        func.__runs_after__ = (  # type: ignore[attr-defined]
+            *getattr(func, "__runs_after__", ()),
+            *handlers,
+        )
+        return func
+
+    return decorator
+
+
+def handler_name(handler: Handler) -> str:
+    return f"{handler.__module__}.{handler.__qualname__}"
+
+
+def event_key(event: Event) -> Optional[Hashable]:
+    data = event.data
+    repository = data.get("repository", {}).get("full_name")
+    for name in ("pull_request", "issue"):
+        if name in data:
+            return repository, data[name]["number"]
+
+    pull_requests = data.get("check_run", {}).get("pull_requests")
+    if pull_requests:
+        return repository, pull_requests[0]["number"]
+    return None
+
+
+async def dispatch(
+    router: Router,
+    event: Event,
+    *args: Any,
+    completed: Optional[set[str]] = None,
+    recheck: Optional[Recheck] = None,
+    **kwargs: Any,
+) -> None:
+    # completed diisi nama handler yang berhasil, supaya retry job tidak mengirim
+    # ulang review atau komentar dari handler yang sudah selesai. recheck dipanggil
+    # sebelum handler yang menunggu handler lain, misalnya untuk memastikan PR
+    # belum ditutup oleh dependency-nya
+    tasks: dict[Handler, asyncio.Task[None]] = {}
+
+    async def run(handler: Handler) -> None:
+        waits_for = [
+            tasks[dependency]
+            for dependency in getattr(handler, "__runs_after__", ())
+            if dependency in tasks
+        ]
+        if waits_for:
+            await asyncio.wait(waits_for)
+            failed = [
+                task for task in waits_for if task.cancelled() or task.exception()
+            ]
+            if failed:
+                logger.info(
+                    "handler %s dilewati, %s dependency gagal",
+                    handler.__name__,
+                    len(failed),
+                )
+                return None
+            if recheck is not None and not await recheck():
+                logger.info("handler %s dilewati setelah recheck", handler.__name__)
+                return None
+        name = handler_name(handler)
+        if completed is not None and name in completed:
+            logger.info("handler %s sudah selesai, dilewati", handler.__name__)
+            return None
+
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"handler {handler.__name__}"):
+                await handler(event, *args, **kwargs)
+            if completed is not None:
+                completed.add(name)
+        except Exception:
+            HANDLER_ERRORS.inc(handler.__name__)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - start, handler.__name__)
+
+    with tracer.span("dispatch") as span:
+        for handler in router.fetch(event):
+            tasks[handler] = asyncio.ensure_future(run(handler))
+        if span is not None:
+            span.set(handlers=len(tasks))
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    errors = [
+        (handler, result)
+        for handler, result in zip(tasks, results)
+        if isinstance(result, BaseException)
+    ]
+    for handler, error in errors[1:]:
+        logger.error("handler %s gagal: %r", handler.__name__, error, exc_info=error)
+    if errors:
+        raise errors[0][1]
@@ -1,5 +1,11 @@
+from __future__ import annotations
+
+import functools
 import logging
-from typing import Any
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
 
 from gidgethub import routing
 from gidgethub.sansio import Event
@@ -7,58 +13,196 @@ from gidgethub.sansio import Event
 from bellshadebot import utils
 from bellshadebot.api import GitHubAPI
 from bellshadebot.constant import Label
+from bellshadebot.jobqueue import JobQueue
+from bellshadebot.scheduler import task_scheduler
+
+CHECK_RUN_DEBOUNCE = float(os.environ.get("CHECK_RUN_DEBOUNCE", "10"))
+CHECK_RUN_STATE_TTL = float(os.environ.get("CHECK_RUN_STATE_TTL", "3600"))
+PENDING_STATUSES: frozenset[str] = frozenset(
+    {"queued", "in_progress", "requested", "waiting", "pending"}
+)
+FAILED_CONCLUSIONS: tuple[Optional[str], ...] = (None, "failure", "timed_out")
+# action event sintetis dari CheckRunAggregator, bukan dari GitHub
+SETTLED_ACTION = "bellshadebot_settled"
 
 check_run_router = routing.Router()
 logger = logging.getLogger(__package__)
 
 
-@check_run_router.register("check_run", action="completed")
-async def check_ci_status_and_label(
-    event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
-) -> None:
-    repository = event.data["repository"]["full_name"]
+@dataclass
+class CheckSuiteState:
+    repository: str
+    head_sha: str
+    runs: dict[int, str] = field(default_factory=dict)
+    events: int = 0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def settled(self) -> bool:
+        return all(status not in PENDING_STATUSES for status in self.runs.values())
+
+
+def settled_event(event: Event) -> Event:
+    # event sintetis untuk job evaluasi, delivery_id tetap per commit supaya job
+    # yang masih antre digabung (debounce) oleh JobQueue.schedule
+    data = event.data
+    check_run = data["check_run"]
+    repository = data["repository"]["full_name"]
+    return Event(
+        {
+            "action": SETTLED_ACTION,
+            "repository": {"full_name": repository},
+            "installation": data.get("installation"),
+            "check_run": {
+                "head_sha": check_run["head_sha"],
+                "pull_requests": check_run.get("pull_requests", []),
+            },
+        },
+        event="check_run",
+        delivery_id=f"check_runs:{repository}@{check_run['head_sha']}",
+    )
+
+
+class CheckRunAggregator:
+    def __init__(
+        self,
+        debounce: float = CHECK_RUN_DEBOUNCE,
+        ttl: float = CHECK_RUN_STATE_TTL,
+        jobs: Optional[JobQueue] = None,
+    ) -> None:
+        self._debounce = debounce
+        self._ttl = ttl
+        self._suites: dict[tuple[str, str], CheckSuiteState] = {}
+        # diisi saat app start. tanpa job queue evaluasi hanya dijadwalkan di memori
+        # dan hilang kalau proses restart
+        self.jobs = jobs
+
+    def __len__(self) -> int:
+        return len(self._suites)
+
+    async def update(self, gh: GitHubAPI, event: Event) -> None:
+        self._expire()
+        check_run = event.data["check_run"]
+        key = (event.data["repository"]["full_name"], check_run["head_sha"])
+        suite = self._suites.get(key)
+        if suite is None:
+            suite = self._suites[key] = CheckSuiteState(*key)
+
+        suite.runs[check_run["id"]] = check_run["status"]
+        suite.events += 1
+        suite.updated_at = time.monotonic()
+        if self.jobs is not None:
+            settled = settled_event(event)
+            if suite.settled:
+                await self.jobs.schedule(settled, self._debounce)
+            else:
+                await self.jobs.cancel(settled.delivery_id)
+        elif suite.settled:
+            task_scheduler.schedule(
+                ("check_runs", *key),
+                self._debounce,
+                functools.partial(self._evaluate, key, gh.clone()),
+            )
+        else:
+            task_scheduler.cancel(("check_runs", *key))
+
+    def settle(self, key: tuple[str, str]) -> None:
+        suite = self._suites.pop(key, None)
+        commit = f"https://github.com/{key[0]}/commit/{key[1]}"
+        if suite is None:
+            # state hilang kalau proses restart sejak event terakhir, tetap dievaluasi
+            logger.info("check run dievaluasi tanpa state: commit=%s", commit)
+            return None
+
+        logger.info(
+            "check run dievaluasi: events=%s runs=%s commit=%s",
+            suite.events,
+            len(suite.runs),
+            commit,
+        )
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self._ttl
+        for key in [k for k, s in self._suites.items() if s.updated_at < deadline]:
+            del self._suites[key]
+            task_scheduler.cancel(("check_runs", *key))
+
+    async def _evaluate(self, key: tuple[str, str], gh: GitHubAPI) -> None:
+        if key not in self._suites:
+            return None
+
+        self.settle(key)
+        try:
+            await evaluate_check_runs(gh, repository=key[0], commit_sha=key[1])
+        finally:
+            await gh.labels.apply(gh)
+
 
-    try:
-        commit_sha = event.data["check_run"]["head_sha"]
-        pr_for_commit = await utils.get_pr_for_commit(
+check_run_aggregator = CheckRunAggregator()
+
+
+async def evaluate_check_runs(
+    gh: GitHubAPI,
+    *,
+    repository: str,
+    commit_sha: str,
+    pull_request: Optional[Mapping[str, Any]] = None,
+) -> None:
+    if pull_request is None:
+        pull_request = await utils.get_pr_for_commit(
             gh, sha=commit_sha, repository=repository
         )
-    except KeyError:
-        commit_sha = event.data["pull_request"]["head"]["sha"]
-        pr_for_commit = event.data["pull_request"]
 
-    if pr_for_commit is None:
+    if pull_request is None:
         logger.info(
             "pull request tidak ditemukan untuk commit : %s",
             f"https://github.com/{repository}/commit/{commit_sha}",
         )
         return None
 
-    check_runs = await utils.get_check_runs_for_commit(
-        gh, sha=commit_sha, repository=repository
+    snapshot = await utils.get_pr_snapshot(gh, pull_request=pull_request)
+    if snapshot.head_sha != commit_sha or any(
+        check_run.status in PENDING_STATUSES for check_run in snapshot.check_runs
+    ):
+        return None
+
+    if any(
+        check_run.conclusion in FAILED_CONCLUSIONS for check_run in snapshot.check_runs
+    ):
+        await utils.add_label_to_pr_or_issue(
+            gh, label=Label.FAILED_TEST, pr_or_issue=pull_request
+        )
+    else:
+        await utils.remove_label_from_pr_or_issue(
+            gh, label=Label.FAILED_TEST, pr_or_issue=pull_request
+        )
+
+
+@check_run_router.register("check_run", action="created")
+@check_run_router.register("check_run", action="completed")
+async def check_ci_status_and_label(
+    event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
+) -> None:
+    repository = event.data["repository"]["full_name"]
+
+    if "check_run" in event.data:
+        await check_run_aggregator.update(gh, event)
+        return None
+
+    pull_request = event.data["pull_request"]
+    await evaluate_check_runs(
+        gh,
+        repository=repository,
+        commit_sha=pull_request["head"]["sha"],
+        pull_request=pull_request,
     )
 
-    all_check_run_status: list[str] = [
-        check_run["status"] for check_run in check_runs["check_runs"]
-    ]
-    all_check_run_conclusion: list[str] = [
-        check_run["conclusion"] for check_run in check_runs["check_runs"]
-    ]
 
-    if (
-        "in_progress" not in all_check_run_status
-        and "queued" not in all_check_run_status
-    ):
-        current_labels: list[str] = [label["name"] for label in pr_for_commit["labels"]]
-        if any(
-            conclusion in [None, "failure", "timed_out"]
-            for conclusion in all_check_run_conclusion
-        ):
-            if Label.FAILED_TEST not in current_labels:
-                await utils.add_label_to_pr_or_issue(
-                    gh, label=Label.FAILED_TEST, pr_or_issue=pr_for_commit
-                )
-        elif Label.FAILED_TEST in current_labels:
-            await utils.remove_label_from_pr_or_issue(
-                gh, label=Label.FAILED_TEST, pr_or_issue=pr_for_commit
-            )
+@check_run_router.register("check_run", action=SETTLED_ACTION)
+async def evaluate_settled_check_runs(
+    event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
+) -> None:
+    repository = event.data["repository"]["full_name"]
+    commit_sha = event.data["check_run"]["head_sha"]
+    check_run_aggregator.settle((repository, commit_sha))
+    await evaluate_check_runs(gh, repository=repository, commit_sha=commit_sha)
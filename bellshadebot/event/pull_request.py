@@ -2,9 +2,11 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import os
 import re
-from typing import Any, Optional
+from typing import Any, Coroutine, Mapping, Optional
 
+from cachetools import LRUCache
 from gidgethub import routing
 from gidgethub.sansio import Event
 
@@ -18,16 +20,107 @@ from bellshadebot.constant import (
     PR_REVIEW_COMMENT,
     Label,
 )
+from bellshadebot.dispatch import runs_after
+from bellshadebot.index import open_pr_counter, pr_index
 from bellshadebot.parser import PythonParser
+from bellshadebot.parser.executor import LintResult
+from bellshadebot.scheduler import backoff, task_scheduler
+from bellshadebot.tracing import tracer
 
 MAX_PR_PER_USER = 3
 STAGE_PREFIX = "awaiting"
 MAX_RETRIES = 5
+REVIEW_PIPELINES_MAX_TRACKED = int(
+    os.environ.get("REVIEW_PIPELINES_MAX_TRACKED", "10000")
+)
+FILE_FETCH_CONCURRENCY = int(os.environ.get("FILE_FETCH_CONCURRENCY", "8"))
+# format: "<installation id>:<limit>,<installation id>:<limit>"
+FILE_FETCH_CONCURRENCY_PER_INSTALLATION: dict[int, int] = {
+    int(installation_id): int(limit)
+    for installation_id, limit in (
+        item.split(":")
+        for item in os.environ.get("FILE_FETCH_CONCURRENCY_OVERRIDES", "").split(",")
+        if item
+    )
+}
 
 pull_request_router = routing.Router()
 logger = logging.getLogger(__package__)
 
 
+class ReviewPipelines:
+    def __init__(self, max_tracked: int = REVIEW_PIPELINES_MAX_TRACKED) -> None:
+        self._running: dict[str, tuple[str, asyncio.Task[None]]] = {}
+        # head terbaru per PR: (updated_at, head sha). event synchronize bisa datang
+        # terlambat atau diulang oleh job queue, jadi urutan datang tidak cukup
+        self._latest: LRUCache[str, tuple[str, str]] = LRUCache(maxsize=max_tracked)
+
+    def observe(self, pull_request: Mapping[str, Any]) -> bool:
+        head_sha = pull_request["head"]["sha"]
+        updated_at = pull_request.get("updated_at") or ""
+        latest = self._latest.get(pull_request["url"])
+        if latest is not None and latest[1] != head_sha and latest[0] > updated_at:
+            return False
+        self._latest[pull_request["url"]] = (updated_at, head_sha)
+        return True
+
+    def is_latest(self, pull_request: Mapping[str, Any]) -> bool:
+        latest = self._latest.get(pull_request["url"])
+        return latest is None or latest[1] == pull_request["head"]["sha"]
+
+    def cancel_superseded(self, pull_request: dict[str, Any]) -> bool:
+        if not self.observe(pull_request):
+            return False
+
+        entry = self._running.get(pull_request["url"])
+        if entry is None:
+            return False
+
+        head_sha, task = entry
+        if head_sha == pull_request["head"]["sha"] or task.done():
+            return False
+
+        task.cancel()
+        logger.info(
+            "review untuk %s dibatalkan, head baru %s: %s",
+            head_sha[:7],
+            pull_request["head"]["sha"][:7],
+            pull_request["html_url"],
+        )
+        return True
+
+    async def run(
+        self, pull_request: dict[str, Any], pipeline: Coroutine[Any, Any, None]
+    ) -> None:
+        self.cancel_superseded(pull_request)
+        if not self.is_latest(pull_request):
+            pipeline.close()
+            logger.info(
+                "review untuk head lama %s dilewati: %s",
+                pull_request["head"]["sha"][:7],
+                pull_request["html_url"],
+            )
+            return None
+
+        key = pull_request["url"]
+        task = asyncio.ensure_future(pipeline)
+        self._running[key] = (pull_request["head"]["sha"], task)
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._running.get(key, (None, None))[1] is task:
+                del self._running[key]
+
+        if not task.cancelled():
+            task.result()
+
+
+review_pipelines = ReviewPipelines()
+
+
 async def update_stage_label(
     gh: GitHubAPI, *, pull_request: dict[str, Any], next_label: Optional[str] = None
 ) -> None:
@@ -46,13 +139,27 @@ async def update_stage_label(
 
 
 @pull_request_router.register("pull_request", action="opened")
+@pull_request_router.register("pull_request", action="reopened")
+@pull_request_router.register("pull_request", action="synchronize")
 @pull_request_router.register("pull_request", action="ready_for_review")
-async def add_review_labvel_on_pr_opened(
+@pull_request_router.register("pull_request", action="converted_to_draft")
+@pull_request_router.register("pull_request", action="closed")
+async def index_pull_request(
     event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
 ) -> None:
     pull_request = event.data["pull_request"]
-    if not pull_request["draft"]:
-        await update_stage_label(gh, pull_request=pull_request, next_label=Label.REVIEW)
+    repository = event.data["repository"]["full_name"]
+
+    if event.data["action"] == "synchronize":
+        pr_index.discard(repository, event.data["before"])
+    if event.data["action"] == "closed":
+        pr_index.discard(repository, pull_request["head"]["sha"])
+        open_pr_counter.discard(repository, pull_request)
+        task_scheduler.cancel(("merge_status", pull_request["url"]))
+    else:
+        pr_index.add(repository, pull_request)
+        if event.data["action"] in ("opened", "reopened"):
+            open_pr_counter.add(repository, pull_request)
 
 
 @pull_request_router.register("pull_request", action="opened")
@@ -79,15 +186,18 @@ async def close_invalid_or_additional_pr(
             )
             return None
         elif MAX_PR_PER_USER > 0:
-            user_pr_numbers = await utils.get_user_open_pr_numbers(
-                gh,
-                repository=event.data["repository"]["full_name"],
-                user_login=pr_author,
+            user_pr_numbers = set(
+                await utils.get_user_open_pr_numbers(
+                    gh,
+                    repository=event.data["repository"]["full_name"],
+                    user_login=pr_author,
+                )
             )
+            user_pr_numbers.add(pull_request["number"])
 
             if len(user_pr_numbers) > MAX_PR_PER_USER:
                 logger.info("open pr ganda : %s", pull_request["html_url"])
-                pr_number = "#{}".format(", #".join(str, user_pr_numbers))
+                pr_number = "#{}".format(", #".join(map(str, sorted(user_pr_numbers))))
                 await utils.close_pr_or_issue(
                     gh,
                     comment=MAX_PR_REACHED_COMMENT.format(
@@ -95,11 +205,38 @@ async def close_invalid_or_additional_pr(
                     ),
                     pr_or_issue=pull_request,
                 )
-                return None
 
+
+async def is_open_and_valid(gh: GitHubAPI, event: Event) -> bool:
+    # dipanggil dispatch sebelum handler dependent, PR bisa saja sudah ditutup oleh
+    # close_invalid_or_additional_pr di event yang sama
+    pull_request = event.data.get("pull_request")
+    if pull_request is None:
+        return True
+
+    snapshot = await utils.get_pr_snapshot(gh, pull_request=pull_request)
+    return snapshot.state == "open" and Label.INVALID not in snapshot.labels
+
+
+@pull_request_router.register("pull_request", action="opened")
+@runs_after(close_invalid_or_additional_pr)
+async def check_pr_files_on_opened(
+    event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
+) -> None:
     await check_pr_files(event, gh, *args, **kwargs)
 
 
+@pull_request_router.register("pull_request", action="opened")
+@pull_request_router.register("pull_request", action="ready_for_review")
+@runs_after(close_invalid_or_additional_pr)
+async def add_review_labvel_on_pr_opened(
+    event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
+) -> None:
+    pull_request = event.data["pull_request"]
+    if not pull_request["draft"]:
+        await update_stage_label(gh, pull_request=pull_request, next_label=Label.REVIEW)
+
+
 @pull_request_router.register("pull_request", action="reopened")
 @pull_request_router.register("pull_request", action="ready_for_review")
 @pull_request_router.register("pull_request", action="synchronize")
@@ -112,6 +249,22 @@ async def check_pr_files(
         return None
 
     ignore_modified: bool = kwargs.pop("ignore_modified", True)
+    await review_pipelines.run(
+        pull_request,
+        review_pr_files(
+            event, gh, pull_request=pull_request, ignore_modified=ignore_modified
+        ),
+    )
+
+
+async def review_pr_files(
+    event: Event,
+    gh: GitHubAPI,
+    *,
+    pull_request: dict[str, Any],
+    ignore_modified: bool,
+) -> None:
+    # daftar file REST sudah memuat blob SHA untuk kunci lint cache, GraphQL tidak
     pr_files = await utils.get_pr_files(gh, pull_request=pull_request)
     parser = PythonParser(pr_files, pull_request)
 
@@ -132,9 +285,41 @@ async def check_pr_files(
                 gh, label=label, pr_or_issue=pull_request
             )
 
-    for file in parser.files_to_check(ignore_modified):
-        code = await utils.get_file_content(gh, file=file)
-        parser.parse(file, code)
+    fetch_limit = asyncio.Semaphore(
+        FILE_FETCH_CONCURRENCY_PER_INSTALLATION.get(
+            gh.installation_id, FILE_FETCH_CONCURRENCY
+        )
+    )
+
+    cache_hits = cache_misses = 0
+
+    async def fetch_and_lint(file: utils.File) -> Optional[LintResult]:
+        nonlocal cache_hits, cache_misses
+        if (result := parser.cached_result(file)) is not None:
+            cache_hits += 1
+            return result
+        if file.sha is not None:
+            cache_misses += 1
+
+        async with fetch_limit:
+            source = await utils.get_file_content(gh, file=file)
+        return await parser.lint(file, source)
+
+    files = list(parser.files_to_check(ignore_modified))
+    results = await asyncio.gather(*(fetch_and_lint(file) for file in files))
+    with tracer.span("parser.collect", files=len(files)):
+        for file, result in zip(files, results):
+            parser.add_result(file, result)
+        parser.fill_labels()
+    logger.info(
+        "lint cache hits=%s misses=%s: %s",
+        cache_hits,
+        cache_misses,
+        pull_request["html_url"],
+    )
+
+    if not review_pipelines.is_latest(pull_request):
+        return None
 
     if parser.labels_to_add:
         await utils.add_label_to_pr_or_issue(
@@ -146,6 +331,15 @@ async def check_pr_files(
             gh, label=parser.labels_to_remove, pr_or_issue=pull_request
         )
 
+    # cek ulang tepat sebelum review dikirim, head baru bisa datang selama lint
+    if not review_pipelines.is_latest(pull_request):
+        logger.info(
+            "review untuk head lama %s tidak dikirim: %s",
+            pull_request["head"]["sha"][:7],
+            pull_request["html_url"],
+        )
+        return None
+
     if ignore_modified:
         if comments := parser.collect_comments():
             await utils.create_pr_review(
@@ -211,30 +405,62 @@ async def remove_awaiting_labels(
         await update_stage_label(gh, pull_request=pull_request)
 
 
+async def label_merge_conflict(
+    gh: GitHubAPI, *, pull_request: dict[str, Any], mergeable: bool
+) -> None:
+    if mergeable:
+        await utils.remove_label_from_pr_or_issue(
+            gh, label=Label.MERGE_CONFLICT, pr_or_issue=pull_request
+        )
+    else:
+        await utils.add_label_to_pr_or_issue(
+            gh, label=Label.MERGE_CONFLICT, pr_or_issue=pull_request
+        )
+
+
+def schedule_merge_check(
+    gh: GitHubAPI, *, pull_request: dict[str, Any], attempt: int = 0
+) -> None:
+    key = ("merge_status", pull_request["url"])
+    if attempt >= MAX_RETRIES:
+        logger.info("status mergeable tidak diketahui: %s", pull_request["html_url"])
+        return None
+
+    head_sha = pull_request["head"]["sha"]
+
+    async def recheck() -> None:
+        gh_retry = gh.clone()
+        snapshot = await utils.get_pr_snapshot(gh_retry, pull_request=pull_request)
+        if snapshot.head_sha != head_sha or snapshot.state != "open":
+            return None
+        if snapshot.mergeable is None:
+            schedule_merge_check(
+                gh_retry, pull_request=pull_request, attempt=attempt + 1
+            )
+            return None
+
+        await label_merge_conflict(
+            gh_retry, pull_request=pull_request, mergeable=snapshot.mergeable
+        )
+        await gh_retry.labels.apply(gh_retry)
+
+    task_scheduler.schedule(key, backoff(attempt), recheck)
+
+
 @pull_request_router.register("pull_request", action="opened")
 @pull_request_router.register("pull_request", action="reopened")
 @pull_request_router.register("pull_request", action="synchronize")
+@runs_after(close_invalid_or_additional_pr)
 async def check_merge_status(
     event: Event, gh: GitHubAPI, *args: Any, **kwargs: Any
 ) -> None:
     pull_request = event.data["pull_request"]
 
-    for retry_interval in range(MAX_RETRIES):
-        mergeable: Optional[bool] = pull_request["mergeable"]
-        if mergeable is None:
-            await asyncio.sleep(retry_interval)
-            pull_request = await utils.update_pr(gh, pull_request=pull_request)
-        else:
-            current_labels: list[str] = [
-                label["name"] for label in pull_request["labels"]
-            ]
-            if not mergeable:
-                if Label.MERGE_CONFLICT not in current_labels:
-                    await utils.add_label_to_pr_or_issue(
-                        gh, label=Label.MERGE_CONFLICT, pr_or_issue=pull_request
-                    )
-                elif Label.MERGE_CONFLICT in current_labels:
-                    await utils.remove_label_from_pr_or_issue(
-                        gh, label=Label.MERGE_CONFLICT, pr_or_issue=pull_request
-                    )
-                break
+    if pull_request["mergeable"] is None:
+        schedule_merge_check(gh, pull_request=pull_request)
+        return None
+
+    task_scheduler.cancel(("merge_status", pull_request["url"]))
+    await label_merge_conflict(
+        gh, pull_request=pull_request, mergeable=pull_request["mergeable"]
+    )
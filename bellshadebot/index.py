@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Mapping, Optional
+
+from cachetools import LRUCache
+
+from bellshadebot.store import SqliteStore, open_store
+
+if TYPE_CHECKING:
+    from bellshadebot.api import GitHubAPI
+
+PR_INDEX_MAX_ENTRIES = int(os.environ.get("PR_INDEX_MAX_ENTRIES", "10000"))
+PR_INDEX_DISK_MAX_BYTES = int(
+    os.environ.get("PR_INDEX_DISK_MAX_BYTES", str(16 * 2**20))
+)
+OPEN_PR_RECONCILE_INTERVAL = float(os.environ.get("OPEN_PR_RECONCILE_INTERVAL", "3600"))
+EVICT_EVERY: int = 64
+PR_FIELDS: tuple[str, ...] = (
+    "number",
+    "url",
+    "html_url",
+    "issue_url",
+    "comments_url",
+    "state",
+    "draft",
+)
+
+logger = logging.getLogger(__package__)
+
+
+def trim_pull_request(pull_request: Mapping[str, Any]) -> dict[str, Any]:
+    trimmed = {name: pull_request.get(name) for name in PR_FIELDS}
+    trimmed["head"] = {"sha": pull_request["head"]["sha"]}
+    trimmed["user"] = {"login": pull_request["user"]["login"]}
+    return trimmed
+
+
+class PullRequestIndex:
+    def __init__(
+        self,
+        max_entries: int = PR_INDEX_MAX_ENTRIES,
+        store: Optional[SqliteStore] = None,
+        disk_max_bytes: int = PR_INDEX_DISK_MAX_BYTES,
+    ) -> None:
+        self._memory: LRUCache[str, dict[str, Any]] = LRUCache(maxsize=max_entries)
+        self._store = store
+        self._disk_max_bytes = disk_max_bytes
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(repository: str, sha: str) -> str:
+        return f"{repository}@{sha}"
+
+    def get(self, repository: str, sha: str) -> Optional[dict[str, Any]]:
+        key = self.key(repository, sha)
+        pull_request: Optional[dict[str, Any]] = self._memory.get(key)
+        if pull_request is None and self._store is not None:
+            pull_request = self._store.get(key)
+            if pull_request is not None:
+                self._memory[key] = pull_request
+
+        if pull_request is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return pull_request
+
+    def add(self, repository: str, pull_request: Mapping[str, Any]) -> None:
+        key = self.key(repository, pull_request["head"]["sha"])
+        self._memory[key] = trimmed = trim_pull_request(pull_request)
+        if self._store is not None:
+            self._store.set(key, trimmed)
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._store.evict(self._disk_max_bytes)
+
+    def discard(self, repository: str, sha: str) -> None:
+        key = self.key(repository, sha)
+        self._memory.pop(key, None)
+        if self._store is not None:
+            self._store.delete(key)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+        }
+
+
+pr_index = PullRequestIndex(store=open_store("pr_index"))
+
+
+class OpenPullRequestCounter:
+    def __init__(self, reconcile_interval: float = OPEN_PR_RECONCILE_INTERVAL) -> None:
+        self._reconcile_interval = reconcile_interval
+        self._open: dict[str, dict[str, set[int]]] = {}
+        self._reconciled_at: dict[str, float] = {}
+        self._pending: dict[str, asyncio.Future[None]] = {}
+
+    def add(self, repository: str, pull_request: Mapping[str, Any]) -> None:
+        authors = self._open.setdefault(repository, {})
+        authors.setdefault(pull_request["user"]["login"], set()).add(
+            pull_request["number"]
+        )
+
+    def discard(self, repository: str, pull_request: Mapping[str, Any]) -> None:
+        numbers = self._open.get(repository, {}).get(pull_request["user"]["login"])
+        if numbers is not None:
+            numbers.discard(pull_request["number"])
+
+    async def open_pr_numbers(
+        self, gh: GitHubAPI, *, repository: str, user_login: str
+    ) -> list[int]:
+        reconciled_at = self._reconciled_at.get(repository)
+        if reconciled_at is None or (
+            time.monotonic() - reconciled_at > self._reconcile_interval
+        ):
+            await self._reconcile(gh, repository)
+        return sorted(self._open.get(repository, {}).get(user_login, ()))
+
+    async def _reconcile(self, gh: GitHubAPI, repository: str) -> None:
+        pending = self._pending.get(repository)
+        if pending is None:
+            pending = self._pending[repository] = asyncio.ensure_future(
+                self._list_open(gh, repository)
+            )
+            pending.add_done_callback(lambda _: self._pending.pop(repository, None))
+        await asyncio.shield(pending)
+
+    async def _list_open(self, gh: GitHubAPI, repository: str) -> None:
+        authors: dict[str, set[int]] = {}
+        async for pull_request in gh.getiter(
+            f"/repos/{repository}/pulls?state=open&per_page=100",
+            oauth_token=await gh.access_token,
+        ):
+            authors.setdefault(pull_request["user"]["login"], set()).add(
+                pull_request["number"]
+            )
+        self._open[repository] = authors
+        self._reconciled_at[repository] = time.monotonic()
+        logger.info(
+            "open pr direkonsiliasi: %s pull request dari %s author: %s",
+            sum(map(len, authors.values())),
+            len(authors),
+            repository,
+        )
+
+
+open_pr_counter = OpenPullRequestCounter()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from gidgethub.sansio import Event
+
+from bellshadebot.scheduler import backoff
+from bellshadebot.store import STATE_DB_PATH, connect
+
+# default: file bellshadebot.db di working directory, lihat README
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", STATE_DB_PATH or "bellshadebot.db")
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE = float(os.environ.get("JOB_RETRY_BASE", "30"))
+JOB_RETRY_CAP = float(os.environ.get("JOB_RETRY_CAP", "1800"))
+JOB_LEASE_TIMEOUT = float(os.environ.get("JOB_LEASE_TIMEOUT", "60"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "5"))
+JOB_COMMIT_DELAY = float(os.environ.get("JOB_COMMIT_DELAY", "0.005"))
+JOB_COMMIT_BATCH = int(os.environ.get("JOB_COMMIT_BATCH", "100"))
+JOB_STATES: tuple[str, ...] = ("queued", "leased", "retry")
+
+T = TypeVar("T")
+Operation = Callable[[sqlite3.Connection], Any]
+
+logger = logging.getLogger(__package__)
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    event: Event
+    attempts: int = 0
+    # handler yang sudah selesai di percobaan sebelumnya, tidak dijalankan ulang
+    completed: frozenset[str] = frozenset()
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: str = JOB_QUEUE_PATH,
+        *,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        lease_timeout: float = JOB_LEASE_TIMEOUT,
+        commit_delay: float = JOB_COMMIT_DELAY,
+        commit_batch: int = JOB_COMMIT_BATCH,
+    ) -> None:
+        self.owner = uuid.uuid4().hex
+        self._max_attempts = max_attempts
+        self._lease_timeout = lease_timeout
+        self._commit_delay = commit_delay
+        self._commit_batch = commit_batch
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="jobqueue")
+        self._conn = connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " delivery_id TEXT UNIQUE, event TEXT NOT NULL, data TEXT NOT NULL,"
+            " state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL, owner TEXT, leased_until REAL,"
+            " last_error TEXT, created_at REAL NOT NULL,"
+            " completed TEXT NOT NULL DEFAULT '[]');"
+            "CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, available_at);"
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " id INTEGER PRIMARY KEY, delivery_id TEXT, event TEXT NOT NULL,"
+            " data TEXT NOT NULL, attempts INTEGER NOT NULL, error TEXT,"
+            " created_at REAL NOT NULL, failed_at REAL NOT NULL);"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "completed" not in columns:
+            self._conn.execute(
+                "ALTER TABLE jobs ADD COLUMN completed TEXT NOT NULL DEFAULT '[]'"
+            )
+        self._writes: list[tuple[Operation, asyncio.Future[Any]]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: set[asyncio.Future[None]] = set()
+
+    async def enqueue(self, event: Event) -> Optional[int]:
+        def insert(conn: sqlite3.Connection) -> Optional[int]:
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (delivery_id, event, data, state,"
+                " available_at, owner, leased_until, created_at)"
+                " VALUES (?, ?, ?, 'leased', ?, ?, ?, ?)",
+                (
+                    event.delivery_id,
+                    event.event,
+                    json.dumps(event.data),
+                    now,
+                    self.owner,
+                    now + self._lease_timeout,
+                    now,
+                ),
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+        return await self._write(insert)
+
+    async def schedule(self, event: Event, delay: float) -> None:
+        # job tertunda dengan delivery_id tetap, job yang masih antre diundur lagi
+        # (debounce). job yang sedang berjalan atau menunggu retry tidak diubah
+        def upsert(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            conn.execute(
+                "INSERT INTO jobs (delivery_id, event, data, state, available_at,"
+                " created_at) VALUES (?, ?, ?, 'queued', ?, ?)"
+                " ON CONFLICT (delivery_id) DO UPDATE SET data = excluded.data,"
+                " available_at = excluded.available_at WHERE state = 'queued'",
+                (
+                    event.delivery_id,
+                    event.event,
+                    json.dumps(event.data),
+                    now + delay,
+                    now,
+                ),
+            )
+
+        await self._write(upsert)
+
+    async def cancel(self, delivery_id: str) -> None:
+        await self._write(
+            lambda conn: conn.execute(
+                "DELETE FROM jobs WHERE delivery_id = ? AND state = 'queued'",
+                (delivery_id,),
+            )
+        )
+
+    async def complete(self, job_ids: Iterable[int]) -> None:
+        rows = [(job_id,) for job_id in job_ids]
+        await self._write(
+            lambda conn: conn.executemany("DELETE FROM jobs WHERE id = ?", rows)
+        )
+
+    async def release(self, job_id: int, completed: Iterable[str] = ()) -> None:
+        await self._write(
+            lambda conn: conn.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, leased_until = NULL,"
+                " completed = ? WHERE id = ?",
+                (json.dumps(sorted(completed)), job_id),
+            )
+        )
+
+    async def fail(
+        self, job_id: int, error: BaseException, completed: Iterable[str] = ()
+    ) -> None:
+        def retry_or_bury(conn: sqlite3.Connection) -> None:
+            row = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            attempts, now = row[0] + 1, time.time()
+            if attempts < self._max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET state = 'retry', attempts = ?, available_at = ?,"
+                    " owner = NULL, leased_until = NULL, last_error = ?, completed = ?"
+                    " WHERE id = ?",
+                    (
+                        attempts,
+                        now + backoff(attempts - 1, JOB_RETRY_BASE, JOB_RETRY_CAP),
+                        repr(error),
+                        json.dumps(sorted(completed)),
+                        job_id,
+                    ),
+                )
+                return None
+
+            conn.execute(
+                "INSERT INTO dead_letter (id, delivery_id, event, data, attempts,"
+                " error, created_at, failed_at) SELECT id, delivery_id, event, data,"
+                " ?, ?, created_at, ? FROM jobs WHERE id = ?",
+                (attempts, repr(error), now, job_id),
+            )
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            logger.error("job %s dipindahkan ke dead letter: %r", job_id, error)
+
+        await self._write(retry_or_bury)
+
+    async def lease_due(self, limit: int) -> list[Job]:
+        def lease(conn: sqlite3.Connection) -> list[Job]:
+            now = time.time()
+            rows = conn.execute(
+                "SELECT id, delivery_id, event, data, attempts, completed FROM jobs"
+                " WHERE (state IN ('queued', 'retry') AND available_at <= ?)"
+                " OR (state = 'leased' AND leased_until <= ?)"
+                " ORDER BY id LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?, leased_until = ?"
+                " WHERE id = ?",
+                [(self.owner, now + self._lease_timeout, row[0]) for row in rows],
+            )
+            return [
+                Job(
+                    job_id,
+                    Event(json.loads(data), event=event, delivery_id=delivery_id),
+                    attempts,
+                    frozenset(json.loads(completed)),
+                )
+                for job_id, delivery_id, event, data, attempts, completed in rows
+            ]
+
+        return await self._write(lease)
+
+    async def renew(self, job_ids: Iterable[int]) -> None:
+        leased_until = time.time() + self._lease_timeout
+        rows = [(leased_until, job_id, self.owner) for job_id in job_ids]
+        await self._write(
+            lambda conn: conn.executemany(
+                "UPDATE jobs SET leased_until = ?"
+                " WHERE id = ? AND owner = ? AND state = 'leased'",
+                rows,
+            )
+        )
+
+    async def stats(self) -> dict[str, Any]:
+        def read(conn: sqlite3.Connection) -> dict[str, Any]:
+            states = dict.fromkeys(JOB_STATES, 0)
+            states.update(
+                conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            )
+            oldest = conn.execute("SELECT MIN(created_at) FROM jobs").fetchone()[0]
+            dead_letters = conn.execute(
+                "SELECT delivery_id, event, attempts, error, failed_at"
+                " FROM dead_letter ORDER BY failed_at DESC LIMIT 10"
+            ).fetchall()
+            return {
+                "jobs": states,
+                "oldest_age": time.time() - oldest if oldest else 0.0,
+                "dead_letter": conn.execute(
+                    "SELECT COUNT(*) FROM dead_letter"
+                ).fetchone()[0],
+                "recent_dead_letters": [
+                    dict(
+                        zip(
+                            ("delivery_id", "event", "attempts", "error", "failed_at"),
+                            row,
+                        )
+                    )
+                    for row in dead_letters
+                ],
+            }
+
+        return await self._call(read)
+
+    async def close(self) -> None:
+        self._flush()
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    async def _call(self, operation: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, operation, self._conn)
+
+    async def _write(self, operation: Callable[[sqlite3.Connection], T]) -> T:
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._writes.append((operation, future))
+        if len(self._writes) >= self._commit_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self._commit_delay, self._flush
+            )
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._writes:
+            return None
+
+        writes, self._writes = self._writes, []
+        flushing = asyncio.ensure_future(self._commit(writes))
+        self._flushing.add(flushing)
+        flushing.add_done_callback(self._flushing.discard)
+
+    async def _commit(
+        self, writes: list[tuple[Operation, asyncio.Future[Any]]]
+    ) -> None:
+        def transaction(conn: sqlite3.Connection) -> list[tuple[bool, Any]]:
+            results: list[tuple[bool, Any]] = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for operation, _ in writes:
+                    try:
+                        results.append((True, operation(conn)))
+                    except sqlite3.Error as err:
+                        results.append((False, err))
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            return results
+
+        try:
+            results = await self._call(transaction)
+        except Exception as err:
+            for _, future in writes:
+                if not future.done():
+                    future.set_exception(err)
+            return None
+
+        for (_, future), (ok, result) in zip(writes, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
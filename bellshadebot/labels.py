@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+
+if TYPE_CHECKING:
+    from bellshadebot.api import GitHubAPI
+
+logger = logging.getLogger(__package__)
+
+
+def get_labels_url(pr_or_issue: Mapping[str, Any]) -> str:
+    labels_url: str = (
+        pr_or_issue["labels_url"]
+        if "labels_url" in pr_or_issue
+        else pr_or_issue["issue_url"] + "/labels"
+    )
+    return labels_url.replace("{/name}", "")
+
+
+class LabelReconciler:
+    def __init__(self) -> None:
+        self._changes: dict[str, dict[str, bool]] = {}
+
+    def __bool__(self) -> bool:
+        return any(self._changes.values())
+
+    def add(self, pr_or_issue: Mapping[str, Any], labels: Iterable[str]) -> None:
+        changes = self._changes.setdefault(get_labels_url(pr_or_issue), {})
+        for label in labels:
+            changes[label] = True
+
+    def remove(self, pr_or_issue: Mapping[str, Any], labels: Iterable[str]) -> None:
+        changes = self._changes.setdefault(get_labels_url(pr_or_issue), {})
+        for label in labels:
+            changes[label] = False
+
+    async def apply(self, gh: GitHubAPI) -> None:
+        changes_per_url, self._changes = self._changes, {}
+        for labels_url, changes in changes_per_url.items():
+            if not changes:
+                continue
+
+            current = [
+                label["name"]
+                async for label in gh.getiter(
+                    labels_url, oauth_token=await gh.access_token
+                )
+            ]
+            desired = [label for label in current if changes.get(label, True)]
+            desired += [
+                label for label, add in changes.items() if add and label not in current
+            ]
+            if set(desired) == set(current):
+                continue
+
+            logger.info("labels=%s => %s: %s", current, desired, labels_url)
+            if desired:
+                await gh.put(
+                    labels_url,
+                    data={"labels": desired},
+                    oauth_token=await gh.access_token,
+                )
+            else:
+                await gh.delete(labels_url, oauth_token=await gh.access_token)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Mapping, Optional
+
+from bellshadebot.metrics import LOG_DROPPED
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "kv").lower()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_BODY_MAX_BYTES = int(os.environ.get("LOG_BODY_MAX_BYTES", "512"))
+LOG_BODY_SAMPLE_RATE = float(os.environ.get("LOG_BODY_SAMPLE_RATE", "0.1"))
+# contoh: "GET /repos/{owner}/{repo}/contents/{path}=DEBUG,/graphql=WARNING"
+LOG_ROUTE_LEVELS = os.environ.get("LOG_ROUTE_LEVELS", "")
+
+logger = logging.getLogger(__package__)
+_listener: Optional[QueueListener] = None
+
+
+def parse_route_levels(value: str) -> dict[str, int]:
+    levels: dict[str, int] = {}
+    for entry in filter(None, (item.strip() for item in value.split(","))):
+        route, _, level = entry.rpartition("=")
+        if not route or not isinstance(logging.getLevelName(level.upper()), int):
+            logger.warning("LOG_ROUTE_LEVELS tidak valid: %s", entry)
+            continue
+        levels[route.strip()] = logging.getLevelName(level.upper())
+    return levels
+
+
+ROUTE_LEVELS = parse_route_levels(LOG_ROUTE_LEVELS)
+
+
+def route_level(method: str, route: str, default: int) -> int:
+    if not ROUTE_LEVELS:
+        return default
+    return ROUTE_LEVELS.get(f"{method} {route}", ROUTE_LEVELS.get(route, default))
+
+
+def body_excerpt(
+    body: bytes, *, sampled: bool = True, max_bytes: int = LOG_BODY_MAX_BYTES
+) -> Optional[str]:
+    if not body or not sampled:
+        return None
+    excerpt = body[:max_bytes].decode("utf-8", errors="replace")
+    if len(body) > max_bytes:
+        excerpt += f"...(+{len(body) - max_bytes} bytes)"
+    return excerpt
+
+
+def sample_body(rate: float = LOG_BODY_SAMPLE_RATE) -> bool:
+    return rate >= 1 or random.random() < rate
+
+
+def format_kv(value: Any) -> str:
+    text = str(value)
+    if not text or any(char in text for char in ' "=\n\t'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, style: str = LOG_FORMAT) -> None:
+        super().__init__()
+        self.style = style
+
+    def fields(self, record: logging.LogRecord) -> dict[str, Any]:
+        fields: Mapping[str, Any] = getattr(record, "fields", {})
+        return {key: value for key, value in fields.items() if value is not None}
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        fields = self.fields(record)
+        exc_text = record.exc_text
+        if exc_text is None and record.exc_info:
+            exc_text = self.formatException(record.exc_info)
+
+        if self.style == "json":
+            line = {
+                "ts": round(record.created, 3),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "msg": message,
+                **fields,
+            }
+            if exc_text:
+                line["exc"] = exc_text
+            return json.dumps(line, ensure_ascii=False, default=str)
+
+        pairs = " ".join(f"{key}={format_kv(value)}" for key, value in fields.items())
+        if self.style == "kv":
+            line_text = (
+                f"ts={time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))}"
+                f" level={record.levelname.lower()} logger={record.name}"
+                f" msg={format_kv(message)}"
+            )
+        else:
+            line_text = f"[{record.levelname}] {message}"
+        if pairs:
+            line_text = f"{line_text} {pairs}"
+        if exc_text:
+            if self.style == "kv":
+                line_text = f"{line_text} exc={format_kv(exc_text)}"
+            else:
+                line_text = f"{line_text}\n{exc_text}"
+        return line_text
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # pesan dan traceback dirender di thread pemanggil, I/O di thread listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+def setup_logging(
+    level: str = LOG_LEVEL, style: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE
+) -> QueueListener:
+    global _listener
+    if _listener is not None:
+        atexit.unregister(_listener.stop)
+        _listener.stop()
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(StructuredFormatter(style))
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(queue_size)
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    logging.basicConfig(
+        level=level, handlers=[NonBlockingQueueHandler(log_queue)], force=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    _listener = listener
+    return listener
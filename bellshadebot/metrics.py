@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Iterator, Mapping, Optional
+from urllib.parse import urlsplit
+
+METRICS_BUCKETS: tuple[float, ...] = tuple(
+    float(bucket)
+    for bucket in os.environ.get(
+        "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+# diisi supervisor untuk tiap proses web, lihat BELLSHADEBOT_PROCESSES
+METRICS_PROCESS = os.environ.get("BELLSHADEBOT_PROCESS_INDEX", "0")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+Sample = tuple[str, Labels, Labels, float]
+Collect = Callable[[], Mapping[Labels, Optional[float]]]
+
+SHA_PATTERN = re.compile(r"[0-9a-f]{40}")
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class Metric:
+    kind: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+    def render(
+        self, const_labelnames: Labels = (), const_labels: Labels = ()
+    ) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for name, labelnames, labels, value in self.samples():
+            if labels or const_labels:
+                pairs = ",".join(
+                    f'{key}="{escape(label)}"'
+                    for key, label in zip(
+                        (*const_labelnames, *labelnames), (*const_labels, *labels)
+                    )
+                )
+                name = f"{name}{{{pairs}}}"
+            yield f"{name} {format_value(value)}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        collect: Optional[Collect] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+        self._collect = collect
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        values = self._collect() if self._collect is not None else self._values
+        for labels, value in values.items():
+            if value is not None:
+                yield self.name, self.labelnames, labels, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = METRICS_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # hitungan per bucket disimpan non-kumulatif, dijumlahkan saat scrape
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[Sample]:
+        bucket_labelnames = (*self.labelnames, "le")
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    bucket_labelnames,
+                    (*labels, format_value(bound)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", self.labelnames, labels, total[0]
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+
+class Registry:
+    def __init__(self, **const_labels: str) -> None:
+        # label yang sama di semua sampel, mis. proses asal di mode multi proses
+        self.const_labels = const_labels
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        collect: Optional[Collect] = None,
+    ) -> Counter:
+        counter = Counter(name, documentation, labelnames, collect)
+        self.register(counter)
+        return counter
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        collect: Optional[Collect] = None,
+    ) -> Gauge:
+        gauge = Gauge(name, documentation, labelnames, collect)
+        self.register(gauge)
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = METRICS_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self.register(histogram)
+        return histogram
+
+    def render(self) -> str:
+        return "".join(
+            f"{line}\n"
+            for metric in self._metrics.values()
+            for line in metric.render(
+                tuple(self.const_labels), tuple(self.const_labels.values())
+            )
+        )
+
+
+@lru_cache(maxsize=4096)
+def route_template(url: str) -> str:
+    parts = urlsplit(url).path.strip("/").split("/")
+    if parts[0] == "repos" and len(parts) >= 3:
+        parts[1:3] = ["{owner}", "{repo}"]
+
+    for index, part in enumerate(parts):
+        previous = parts[index - 1] if index else ""
+        if previous == "contents":
+            parts[index:] = ["{path}"]
+            break
+        if previous == "labels":
+            parts[index] = "{name}"
+        elif part.isdigit():
+            parts[index] = "{number}" if previous in ("pulls", "issues") else "{id}"
+        elif SHA_PATTERN.fullmatch(part):
+            parts[index] = "{sha}"
+    return "/" + "/".join(parts)
+
+
+# tiap proses punya counter sendiri, tanpa label ini scrape lewat SO_REUSEPORT
+# terlihat seperti counter yang di-reset
+registry = Registry(process=METRICS_PROCESS)
+
+EVENT_DURATION = registry.histogram(
+    "bellshadebot_event_duration_seconds",
+    "Waktu proses satu webhook event",
+    ("event",),
+)
+HANDLER_DURATION = registry.histogram(
+    "bellshadebot_handler_duration_seconds",
+    "Waktu proses satu handler router",
+    ("handler",),
+)
+HANDLER_ERRORS = registry.counter(
+    "bellshadebot_handler_errors_total",
+    "Jumlah handler router yang gagal",
+    ("handler",),
+)
+GITHUB_REQUESTS = registry.counter(
+    "bellshadebot_github_requests_total",
+    "Jumlah request ke GitHub API",
+    ("method", "route", "status"),
+)
+GITHUB_REQUEST_DURATION = registry.histogram(
+    "bellshadebot_github_request_duration_seconds",
+    "Latency request ke GitHub API",
+    ("method", "route"),
+)
+LOG_DROPPED = registry.counter(
+    "bellshadebot_log_dropped_total",
+    "Log yang dibuang karena antrian logging penuh",
+)
+LINT_DURATION = registry.histogram(
+    "bellshadebot_lint_duration_seconds",
+    "Waktu lint satu file",
+)
+LINT_RULE_DURATION = registry.histogram(
+    "bellshadebot_lint_rule_duration_seconds",
+    "Waktu satu rule lint pada satu file (sampel)",
+    ("rule",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
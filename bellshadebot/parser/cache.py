@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+from typing import Optional
+
+from cachetools import LRUCache
+
+from bellshadebot.parser.executor import LintResult
+from bellshadebot.store import SqliteStore, open_store
+
+LINT_CACHE_MAX_BYTES = int(os.environ.get("LINT_CACHE_MAX_BYTES", str(32 * 2**20)))
+LINT_CACHE_DISK_MAX_BYTES = int(
+    os.environ.get("LINT_CACHE_DISK_MAX_BYTES", str(256 * 2**20))
+)
+EVICT_EVERY: int = 64
+
+logger = logging.getLogger(__package__)
+
+
+class LintCache:
+    def __init__(
+        self,
+        max_bytes: int = LINT_CACHE_MAX_BYTES,
+        store: Optional[SqliteStore] = None,
+        disk_max_bytes: int = LINT_CACHE_DISK_MAX_BYTES,
+    ) -> None:
+        self._memory: LRUCache[str, bytes] = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self._store = store
+        self._disk_max_bytes = disk_max_bytes
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(blob_sha: str, ruleset: str) -> str:
+        return f"{blob_sha}:{ruleset}"
+
+    def get(self, blob_sha: str, ruleset: str) -> Optional[LintResult]:
+        key = self.key(blob_sha, ruleset)
+        data = self._memory.get(key)
+        if data is None and self._store is not None:
+            data = self._store.get_raw(key)
+            if data is not None:
+                self._remember(key, data)
+
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        result: LintResult = pickle.loads(data)
+        return result
+
+    def set(self, blob_sha: str, ruleset: str, result: LintResult) -> None:
+        key = self.key(blob_sha, ruleset)
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        if self._store is not None:
+            self._store.set_raw(key, data)
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._store.evict(self._disk_max_bytes)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._memory),
+            "bytes": int(self._memory.currsize),
+        }
+
+    def _remember(self, key: str, data: bytes) -> None:
+        try:
+            self._memory[key] = data
+        except ValueError:
+            logger.info("lint cache: hasil terlalu besar (%s bytes)", len(data))
+
+
+# tabel baru: baris di tabel lint_cache lama masih di-pickle dua kali
+lint_cache = LintCache(store=open_store("lint_results"))
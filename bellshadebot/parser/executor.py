@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Collection, Optional, Type
+
+from fixit import CstLintRule
+from fixit.common.utils import LintRuleCollectionT
+from fixit.rule_lint_engine import lint_file
+from libcst import ParserSyntaxError
+
+from bellshadebot.metrics import LINT_DURATION, LINT_RULE_DURATION
+from bellshadebot.parser.registry import DEFAULT_CONFIG, get_rule_registry
+
+LINT_WORKERS = int(os.environ.get("LINT_WORKERS", str(os.cpu_count() or 1)))
+LINT_TIMEOUT = float(os.environ.get("LINT_TIMEOUT", "30"))
+LINT_RULE_TIMING_RATE = float(os.environ.get("LINT_RULE_TIMING_RATE", "0.05"))
+
+logger = logging.getLogger(__package__)
+
+
+@dataclass(frozen=True)
+class LintReport:
+    code: str
+    message: str
+    line: int
+    column: int
+
+
+@dataclass(frozen=True)
+class LintResult:
+    reports: tuple[LintReport, ...] = ()
+    error: Optional[str] = None
+    error_line: int = 1
+    duration: float = field(default=0.0, compare=False)
+    rule_durations: tuple[tuple[str, float], ...] = field(default=(), compare=False)
+
+
+_rule_durations: dict[str, float] = {}
+
+
+def _init_worker() -> None:
+    get_rule_registry()
+
+
+def _timed_visitor(name: str, visitor: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def visit(node: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return visitor(node)
+        finally:
+            _rule_durations[name] += time.perf_counter() - start
+
+    return visit
+
+
+@lru_cache(maxsize=None)
+def _timed_rule(rule: Type[CstLintRule]) -> Type[CstLintRule]:
+    # subclass dengan nama yang sama supaya kode report dan config rule tidak berubah
+    class TimedRule(rule):  # type: ignore[valid-type, misc]
+        def get_visitors(self) -> dict[str, Callable[[Any], Any]]:
+            return {
+                name: _timed_visitor(rule.__name__, visitor)
+                for name, visitor in super().get_visitors().items()
+            }
+
+    TimedRule.__name__ = rule.__name__
+    TimedRule.__qualname__ = rule.__qualname__
+    return TimedRule
+
+
+def _lint(filepath: str, source: bytes, rule_names: Collection[str]) -> LintResult:
+    selected = [get_rule_registry().by_name[name] for name in rule_names]
+    timed = random.random() < LINT_RULE_TIMING_RATE
+    if timed:
+        _rule_durations.clear()
+        _rule_durations.update((rule.__name__, 0.0) for rule in selected)
+        selected = [_timed_rule(rule) for rule in selected]
+    rules: LintRuleCollectionT = set(selected)
+
+    start = time.perf_counter()
+    try:
+        reports = lint_file(
+            Path(filepath),
+            source,
+            use_ignore_byte_markers=False,
+            use_ignore_comments=False,
+            config=DEFAULT_CONFIG,
+            rules=rules,
+        )
+    except (SyntaxError, ParserSyntaxError) as exc:
+        if isinstance(exc, SyntaxError):
+            lineno = exc.lineno or 1
+        else:
+            lineno = exc.raw_line
+        return LintResult(
+            error=traceback.format_exc(limit=1),
+            error_line=lineno,
+            duration=time.perf_counter() - start,
+        )
+
+    return LintResult(
+        tuple(
+            LintReport(report.code, report.message, report.line, report.column)
+            for report in reports
+        ),
+        duration=time.perf_counter() - start,
+        rule_durations=tuple(_rule_durations.items()) if timed else (),
+    )
+
+
+def _observe(result: LintResult) -> LintResult:
+    LINT_DURATION.observe(result.duration)
+    for rule, duration in result.rule_durations:
+        LINT_RULE_DURATION.observe(duration, rule)
+    return result
+
+
+class LintExecutor:
+    def __init__(
+        self, workers: int = LINT_WORKERS, timeout: float = LINT_TIMEOUT
+    ) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self.workers <= 0:
+            _init_worker()
+        elif self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> None:
+        # wait_for tidak bisa menghentikan _lint yang sedang jalan di worker, tanpa
+        # dibunuh worker itu tetap terpakai dan pool lama-lama habis
+        if self._pool is pool:
+            self._pool = None
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        # tanpa cancel_futures: lint lain di pool ini mendapat BrokenProcessPool dan
+        # diulang di pool baru, bukan CancelledError
+        pool.shutdown(wait=False)
+
+    async def lint(
+        self, filepath: Path, source: bytes, rule_names: Collection[str]
+    ) -> Optional[LintResult]:
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            self.start()
+            pool = self._pool
+            if pool is None:
+                return _observe(_lint(str(filepath), source, frozenset(rule_names)))
+
+            try:
+                return _observe(
+                    await asyncio.wait_for(
+                        loop.run_in_executor(
+                            pool, _lint, str(filepath), source, frozenset(rule_names)
+                        ),
+                        self.timeout,
+                    )
+                )
+            except asyncio.TimeoutError:
+                logger.warning("lint timeout (%ss): %s", self.timeout, filepath)
+                self._recycle(pool)
+                return None
+            except BrokenProcessPool:
+                if pool is not self._pool:
+                    # pool dihentikan karena timeout lint lain, ulangi di pool baru
+                    continue
+                logger.exception("lint worker mati, pool dibuat ulang: %s", filepath)
+                self._recycle(pool)
+                return None
+
+        return None
+
+
+lint_executor = LintExecutor()
@@ -1,48 +1,23 @@
 from __future__ import annotations
 
-import importlib
-import inspect
 import logging
-from typing import Any, Iterable, Iterator, Mapping
-
-from fixit import CstLintRule, LintConfig
-from fixit.common.utils import LintRuleCollectionT
-from fixit.rule_lint_engine import lint_file
-from libcst import ParserSyntaxError
+from typing import Any, Iterable, Iterator, Mapping, Optional
 
+from bellshadebot.parser.cache import lint_cache
+from bellshadebot.parser.executor import LintResult, lint_executor
 from bellshadebot.parser.files_parser import BaseFilesParser
 from bellshadebot.parser.record import PullRequestReviewRecord
+from bellshadebot.parser.registry import RuleRegistry, get_rule_registry
 from bellshadebot.parser.rules import RequireDoctestRule
+from bellshadebot.tracing import tracer
 from bellshadebot.utils import File
 
-RULES_DOTPATH: str = "bellshadebot.parser.rules"
-
-DEFAULT_CONFIG: LintConfig = LintConfig(packages=[RULES_DOTPATH])
-logger = logging.get_logger(__package__)
-
-
-def get_rules_from_config(config: LintConfig = DEFAULT_CONFIG) -> LintRuleCollectionT:
-    rules: LintRuleCollectionT = set()
-    block_list_rules = config.block.list_rules
-    for package in config.packages:
-        pkg = importlib.import_module(package)
-        for name in dir(pkg):
-            if name.endswith("Rule"):
-                obj = getattr(pkg, name)
-                if (
-                    obj is not CstLintRule
-                    and issubclass(obj, CstLintRule)
-                    and not inspect.isabstract(obj)
-                    and name not in block_list_rules
-                ):
-                    rules.add(obj)
-
-    return rules
+logger = logging.getLogger(__package__)
 
 
 class PythonParser(BaseFilesParser):
-    _pr_report: PullRequestReviewRecord
-    _rules: LintRuleCollectionT
+    _pr_record: PullRequestReviewRecord
+    _registry: RuleRegistry
 
     DOCS_EXTENSION: tuple[str, ...] = (".md", ".rst")
 
@@ -64,12 +39,12 @@ class PythonParser(BaseFilesParser):
     ) -> None:
         super().__init__(pr_files, pull_request)
         self._pr_record = PullRequestReviewRecord()
-        self._rules = get_rules_from_config()
+        self._registry = get_rule_registry()
         if self._contains_testfile():
-            self._rules.discard(RequireDoctestRule)
-
-    property
+            self._registry = self._registry.without(RequireDoctestRule)
+        self.ruleset = self._registry.hash
 
+    @property
     def labels_to_add(self) -> list[str]:
         return self._pr_record.labels_to_add
 
@@ -100,24 +75,47 @@ class PythonParser(BaseFilesParser):
             ):
                 yield file
 
+    def fill_labels(self) -> None:
         self._pr_record.fill_labels(self.pr_labels)
 
-    def parse(self, file: File, source: bytes) -> None:
-        try:
-            reports = lint_file(
-                file.path,
-                source,
-                use_ignore_byte_markers=False,
-                use_ignore_comments=False,
-                config=DEFAULT_CONFIG,
-                rules=self._rules,
-            )
-            self._pr_record.add_comments(reports, file.name)
-        except (SyntaxError, ParserSyntaxError) as exc:
-            self._pr_record.add_error(exc, file.name)
+    def cached_result(self, file: File) -> Optional[LintResult]:
+        if file.sha is None:
+            return None
+        with tracer.span("parser.lint_cache", {"code.filepath": file.name}) as span:
+            result = lint_cache.get(file.sha, self.ruleset)
+            if span is not None:
+                span.set(hit=result is not None)
+        return result
+
+    async def lint(self, file: File, source: bytes) -> Optional[LintResult]:
+        with tracer.span("parser.lint_file", {"code.filepath": file.name}) as span:
+            result = await lint_executor.lint(file.path, source, self._registry.names)
+            if span is not None and result is not None:
+                # selisih dengan durasi span adalah waktu antre di pool lint
+                span.set(
+                    **{
+                        "lint.duration": result.duration,
+                        "lint.reports": len(result.reports),
+                    }
+                )
+        if result is not None and file.sha is not None:
+            lint_cache.set(file.sha, self.ruleset, result)
+        return result
+
+    def add_result(self, file: File, result: Optional[LintResult]) -> None:
+        if result is None:
+            return None
+
+        if result.error is not None:
+            self._pr_record.add_error(result.error, result.error_line, file.name)
             logger.info(
                 "invalid kode python pada file: [%s] %s", file.name, self.pr_html_url
             )
+        else:
+            self._pr_record.add_comments(result.reports, file.name)
+
+    async def parse(self, file: File, source: bytes) -> None:
+        self.add_result(file, await self.lint(file, source))
 
     def _contains_testfile(self) -> bool:
         for file in self.pr_files:
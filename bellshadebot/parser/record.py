@@ -1,62 +1,69 @@
 from __future__ import annotations
 
-import traceback
-from dataclasses import asdict, dataclass, field
-from typing import Any, Collection, Union
-
-from fixit.common.report import BaseLintRuleReport
-from libcst import ParserSyntaxError
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Collection, Iterator
 
 from bellshadebot.constant import Label
+from bellshadebot.parser.executor import LintReport
 
 RULE_TO_LABEL: dict[str, str] = {
-    "RequeireDescriptiveNameRule": Label.DESCRIPTIVE_NAME,
+    "RequireDescriptiveNameRule": Label.DESCRIPTIVE_NAME,
     "RequireDoctestRule": Label.REQUIRE_TEST,
     "RequireTypeHintRule": Label.TYPE_HINT,
 }
 MULTIPLE_COMMENT_SEPARATOR: str = "\n\n"
+MAX_COMMENTS_PER_FILE = int(os.environ.get("MAX_COMMENTS_PER_FILE", "30"))
+TRUNCATED_COMMENTS: str = (
+    "**{hidden} komentar lainnya pada `{filepath}` tidak ditampilkan,"
+    + " silahkan perbaiki komentar diatas terlebih dahulu**"
+)
 
 
 @dataclass(frozen=False)
 class ReviewComment:
-    body: str
     path: str
-    line: str
+    line: int
+    messages: list[str] = field(default_factory=list)
     side: str = field(init=False, default="RIGHT")
 
+    @property
+    def body(self) -> str:
+        return MULTIPLE_COMMENT_SEPARATOR.join(self.messages)
+
+    def asdict(self) -> dict[str, Any]:
+        return {
+            "body": self.body,
+            "path": self.path,
+            "line": self.line,
+            "side": self.side,
+        }
+
 
 @dataclass
-class PUllRequestReviewRecord:
+class PullRequestReviewRecord:
     labels_to_add: list[str] = field(default_factory=list, init=False)
     labels_to_remove: list[str] = field(default_factory=list, init=False)
+    max_comments_per_file: int = MAX_COMMENTS_PER_FILE
+
+    _comments: dict[tuple[str, int], ReviewComment] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _violated_rules: set[str] = field(default_factory=set, init=False, repr=False)
 
-    _comments: list[ReviewComment] = field(default_factory=list, init=False, repr=False)
-    _violated_ruoles: set[str] = field(default_factory=set, init=False, repr=False)
-
-    def add_comments(
-        self, reports: Collection[BaseLintRuleReport], filepath: str
-    ) -> None:
-        for report in reports:
-            self._violated_ruoles.add(report.code)
-            if self._lineno_exist(report.message, filepath, report.line):
-                continue
-            self._comments.append(ReviewComment(report.message, filepath, report.line))
-
-    def add_error(
-        self, exc: Union[SyntaxError, ParserSyntaxError], filepath: str
-    ) -> None:
-        message = traceback.format_exc(limit=1)
-        if isinstance(exc, SyntaxError):
-            lineno = exc.lineno or 1
-        else:
-            lineno = exc.raw_line
+    def add_comments(self, reports: Collection[LintReport], filepath: str) -> None:
+        for report in sorted(reports, key=lambda r: (r.line, r.column, r.code)):
+            self._violated_rules.add(report.code)
+            self._add_message(filepath, report.line, report.message)
 
+    def add_error(self, message: str, lineno: int, filepath: str) -> None:
         body = f"error ketika parsing file: `{filepath}`\n" f"```python\n{message}\n```"
-        self._comments.append(ReviewComment(body, filepath, lineno))
+        self._add_message(filepath, lineno, body)
 
     def fill_labels(self, current_labels: Collection[str]) -> None:
         for rule, label in RULE_TO_LABEL.items():
-            if rule in self._violated_ruoles:
+            if rule in self._violated_rules:
                 if label not in current_labels and label not in self.labels_to_add:
                     self.labels_to_add.append(label)
 
@@ -64,23 +71,38 @@ class PUllRequestReviewRecord:
                 self.labels_to_remove.append(label)
 
     def collect_comments(self) -> list[dict[str, Any]]:
-        return [asdict(comment) for comment in self._comments]
+        return [comment.asdict() for comment in self._summarized_comments()]
 
     def collect_review_contents(self) -> list[str]:
         content = []
-        for comment in self._comments:
-            if MULTIPLE_COMMENT_SEPARATOR in comment.body:
-                comment.body = comment.body.replace(
-                    MULTIPLE_COMMENT_SEPARATOR,
-                    f"{MULTIPLE_COMMENT_SEPARATOR}**{comment.path}:{comment.line}**",
-                )
-            content.append(f"**{comment.path}:{comment.line}:** {comment.body}")
+        for comment in self._summarized_comments():
+            prefix = f"**{comment.path}:{comment.line}**"
+            body = f"{MULTIPLE_COMMENT_SEPARATOR}{prefix}".join(comment.messages)
+            content.append(f"**{comment.path}:{comment.line}:** {body}")
 
         return content
 
-    def _lineno_exist(self, body: str, filepath: str, lineno: int) -> bool:
-        for comment in self._comments:
-            if comment.line == lineno and comment.path == filepath:
-                comment.body += f"{MULTIPLE_COMMENT_SEPARATOR}{body}"
-                return True
-        return False
+    def _add_message(self, filepath: str, lineno: int, message: str) -> None:
+        key = (filepath, lineno)
+        comment = self._comments.get(key)
+        if comment is None:
+            comment = self._comments[key] = ReviewComment(filepath, lineno)
+        comment.messages.append(message)
+
+    def _summarized_comments(self) -> Iterator[ReviewComment]:
+        limit = self.max_comments_per_file
+        per_file = Counter(path for path, _ in self._comments)
+        seen: Counter[str] = Counter()
+        for key in sorted(self._comments):
+            comment = self._comments[key]
+            seen[comment.path] += 1
+            total = per_file[comment.path]
+            if limit <= 0 or total <= limit or seen[comment.path] < limit:
+                yield comment
+            elif seen[comment.path] == limit:
+                summary = TRUNCATED_COMMENTS.format(
+                    hidden=total - limit, filepath=comment.path
+                )
+                yield ReviewComment(
+                    comment.path, comment.line, comment.messages + [summary]
+                )
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import inspect
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from importlib.metadata import version
+from types import MappingProxyType
+from typing import Mapping, Type
+
+from fixit import CstLintRule, LintConfig
+
+RULES_DOTPATH: str = "bellshadebot.parser.rules"
+
+DEFAULT_CONFIG: LintConfig = LintConfig(packages=[RULES_DOTPATH])
+logger = logging.getLogger(__package__)
+
+
+def get_rules_from_config(
+    config: LintConfig = DEFAULT_CONFIG,
+) -> set[Type[CstLintRule]]:
+    rules: set[Type[CstLintRule]] = set()
+    block_list_rules = config.block_list_rules
+    for package in config.packages:
+        pkg = importlib.import_module(package)
+        for name in dir(pkg):
+            if name.endswith("Rule"):
+                obj = getattr(pkg, name)
+                if (
+                    obj is not CstLintRule
+                    and issubclass(obj, CstLintRule)
+                    and not inspect.isabstract(obj)
+                    and name not in block_list_rules
+                ):
+                    rules.add(obj)
+
+    return rules
+
+
+def rule_path(rule: Type[CstLintRule]) -> str:
+    return f"{rule.__module__}.{rule.__qualname__}"
+
+
+@lru_cache(maxsize=None)
+def rule_source(rule: Type[CstLintRule]) -> str:
+    try:
+        return inspect.getsource(sys.modules[rule.__module__])
+    except (OSError, TypeError):
+        logger.warning("source rule %s tidak tersedia", rule_path(rule))
+        return ""
+
+
+@dataclass(frozen=True)
+class RuleRegistry:
+    rules: frozenset[Type[CstLintRule]]
+    _variants: Mapping[frozenset[str], RuleRegistry] = field(
+        default_factory=lambda: MappingProxyType({}), compare=False, repr=False
+    )
+
+    @classmethod
+    def build(cls, rules: frozenset[Type[CstLintRule]]) -> RuleRegistry:
+        # varian tanpa satu rule dibuat di awal supaya registry tidak pernah diubah
+        variants = {
+            frozenset({rule.__name__}): cls(rules.difference({rule})) for rule in rules
+        }
+        return cls(rules, MappingProxyType(variants))
+
+    @cached_property
+    def by_name(self) -> dict[str, Type[CstLintRule]]:
+        return {rule.__name__: rule for rule in self.rules}
+
+    @cached_property
+    def names(self) -> frozenset[str]:
+        return frozenset(self.by_name)
+
+    @cached_property
+    def hash(self) -> str:
+        # source module rule ikut di-hash supaya perubahan kode rule (bukan hanya
+        # daftar rule) tidak memakai hasil lint cache yang lama
+        digest = hashlib.sha1()
+        for package in ("fixit", "libcst"):
+            digest.update(f"{package}=={version(package)}\n".encode())
+        for rule in sorted(self.rules, key=rule_path):
+            digest.update(f"{rule_path(rule)}\n".encode())
+            digest.update(rule_source(rule).encode())
+        return digest.hexdigest()
+
+    def without(self, *rules: Type[CstLintRule]) -> RuleRegistry:
+        variant = self._variants.get(frozenset(rule.__name__ for rule in rules))
+        if variant is None:
+            variant = RuleRegistry(self.rules.difference(rules))
+        return variant
+
+
+@lru_cache(maxsize=None)
+def get_rule_registry() -> RuleRegistry:
+    start = time.perf_counter()
+    registry = RuleRegistry.build(frozenset(get_rules_from_config()))
+    logger.info(
+        "lint rules loaded=[%s] time=%.1fms",
+        ", ".join(sorted(registry.names)),
+        (time.perf_counter() - start) * 1000,
+    )
+    return registry
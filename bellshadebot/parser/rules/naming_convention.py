@@ -38,8 +38,6 @@ class NamingConvention(Enum):
 
 class NamingConventionRule(CstLintRule):
 
-    METADATA_DEPENDENCIES = (QualifiedNameProvider,)  # type: ignore
-
     VALID = [
         Valid("type_hint: str"),
         Valid("type_hint_var: int = 5"),
@@ -102,10 +100,8 @@ class NamingConventionRule(CstLintRule):
         super().__init__(context)
         self._assigntarget_counter: int = 0
 
-    def visit_Assign(self, node: cst.Assing) -> None:
-        metadata: Optional[Collection[QualifiedName]] = self.get_metadata(
-            QualifiedNameProvider, node.value, None
-        )
+    def visit_Assign(self, node: cst.Assign) -> None:
+        metadata = self._qualified_names(node.value)
         if metadata is not None:
             for qualname in metadata:
                 if qualname.name.startswith(("typing", "colelctions")):
@@ -164,6 +160,16 @@ class NamingConventionRule(CstLintRule):
     def visit_Param(self, node: cst.Param) -> None:
         self._validate_nodename(node, node.name.value, NamingConvention.SNAKE_CASE)
 
+    def _qualified_names(
+        self, node: cst.BaseExpression
+    ) -> Optional[Collection[QualifiedName]]:
+        # scope analysis hanya dijalankan jika ada node yang membutuhkannya
+        if not m.matches(node, m.Name() | m.Attribute() | m.Call() | m.Subscript()):
+            return None
+        qualified_names = self.context.wrapper.resolve(QualifiedNameProvider).get(node)
+        # libcst versi baru menyimpan metadata ini sebagai LazyValue
+        return qualified_names() if callable(qualified_names) else qualified_names
+
     def _validate_nodename(
         self, node: cst.CSTNode, nodename: str, naming_convention: NamingConvention
     ) -> None:
@@ -1,14 +1,14 @@
 from typing import Union
 
+import libcst as cst
 from fixit import CstLintRule
 from fixit import InvalidTestCase as Invalid
 from fixit import ValidTestCase as Valid
-from libcst import cst
 
 MESSAGE: str = "masukkan deksripsi yang benar {nodetype}: `{nodename}`"
 
 
-class RequireDescriptiveName(CstLintRule):
+class RequireDescriptiveNameRule(CstLintRule):
 
     VALID = [
         Valid(
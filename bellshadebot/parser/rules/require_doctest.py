@@ -6,10 +6,10 @@ from fixit import CstContext, CstLintRule
 from fixit import InvalidTestCase as Invalid
 from fixit import ValidTestCase as Valid
 
-MISSING_DOCTEST: str = [
+MISSING_DOCTEST: str = (
     "file tersebut tidak memiliki doctest pada fungsi atau kelas"
     + " pastikan gunakan fungsi doctest pada fungsi `{nodename}`"
-]
+)
 
 INIT: str = "__init__"
 
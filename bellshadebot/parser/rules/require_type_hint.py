@@ -7,11 +7,11 @@ from fixit import ValidTestCase as Valid
 
 MISSING_TYPE_HINT: str = "mohon tambahkan type hint pada paramter : `{nodename}`"
 
-MISSING_RETURN_TYPE_HINT: str = [
-    "mohon tambahkan type hint pada return type : `{nodename}`",
-    +"**jika fungsi tidak menghasilkan nilai kembali, mohon gunakan "
-    + "``def function() -> None:``",
-]
+MISSING_RETURN_TYPE_HINT: str = (
+    "mohon tambahkan type hint pada return type : `{nodename}`"
+    + "**jika fungsi tidak menghasilkan nilai kembali, mohon gunakan "
+    + "``def function() -> None:``"
+)
 
 IGNORE_PARAM: set[str] = {"self", "cls"}
 
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import enum
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+from urllib.parse import urlsplit
+
+RATELIMIT_RESERVE = float(os.environ.get("RATELIMIT_RESERVE", "0.1"))
+RATELIMIT_PACE = float(os.environ.get("RATELIMIT_PACE", "0.3"))
+RATELIMIT_MAX_DELAY = float(os.environ.get("RATELIMIT_MAX_DELAY", "300"))
+RATELIMIT_RETRIES = int(os.environ.get("RATELIMIT_RETRIES", "2"))
+# GitHub menyarankan menunggu minimal satu menit untuk secondary rate limit tanpa
+# header retry-after
+RATELIMIT_SECONDARY_DELAY = float(os.environ.get("RATELIMIT_SECONDARY_DELAY", "60"))
+
+logger = logging.getLogger(__package__)
+
+
+class Priority(enum.IntEnum):
+    CRITICAL = 0
+    NORMAL = 1
+    BULK = 2
+
+
+def classify(method: str, url: str) -> Priority:
+    path = urlsplit(url).path
+    if path.endswith("/access_tokens"):
+        return Priority.CRITICAL
+    if method != "GET":
+        if "/labels" in path or method == "PATCH":
+            return Priority.CRITICAL
+        if path.endswith("/reviews"):
+            return Priority.BULK
+        return Priority.NORMAL
+    if path.endswith("/files") or "/contents/" in path or path.startswith("/search/"):
+        return Priority.BULK
+    return Priority.NORMAL
+
+
+def resource(url: str) -> str:
+    # nilai yang sama dengan header x-ratelimit-resource
+    path = urlsplit(url).path
+    if path.endswith("/graphql"):
+        return "graphql"
+    if path.startswith("/search/code"):
+        return "code_search"
+    if path.startswith("/search/"):
+        return "search"
+    return "core"
+
+
+@dataclass
+class Budget:
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    reset: float = 0.0
+    blocked_until: float = 0.0
+    deferred: int = 0
+
+    def delay(self, priority: Priority, now: float) -> float:
+        delay = max(self.blocked_until - now, 0.0)
+        if (
+            priority is Priority.CRITICAL
+            or not self.limit
+            or self.remaining is None
+            or now >= self.reset
+        ):
+            return min(delay, RATELIMIT_MAX_DELAY)
+
+        fraction = self.remaining / self.limit
+        if priority is Priority.BULK and fraction < RATELIMIT_RESERVE:
+            delay = max(delay, self.reset - now)
+        elif fraction < RATELIMIT_PACE:
+            delay = max(delay, (self.reset - now) / max(self.remaining, 1))
+        return min(delay, RATELIMIT_MAX_DELAY)
+
+
+class RateLimitScheduler:
+    def __init__(self) -> None:
+        # budget GitHub terpisah per resource: core, graphql, search, ...
+        self._budgets: dict[tuple[int, str], Budget] = {}
+
+    def budget(self, installation_id: int, resource: str = "core") -> Budget:
+        return self._budgets.setdefault((installation_id, resource), Budget())
+
+    def deferred(self, installation_id: int) -> int:
+        return sum(
+            budget.deferred
+            for (installation, _), budget in self._budgets.items()
+            if installation == installation_id
+        )
+
+    async def acquire(
+        self, installation_id: int, priority: Priority, resource: str = "core"
+    ) -> None:
+        budget = self.budget(installation_id, resource)
+        delay = budget.delay(priority, time.time())
+        if delay > 0:
+            logger.info(
+                "ratelimit defer=%.1fs priority=%s resource=%s installation=%s",
+                delay,
+                priority.name,
+                resource,
+                installation_id,
+            )
+            budget.deferred += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                budget.deferred -= 1
+
+        if budget.remaining is not None:
+            budget.remaining -= 1
+
+    def update(
+        self,
+        installation_id: int,
+        status: int,
+        headers: Mapping[str, str],
+        body: bytes = b"",
+        resource: str = "core",
+    ) -> Optional[float]:
+        resource = headers.get("x-ratelimit-resource", resource)
+        budget = self.budget(installation_id, resource)
+        if "x-ratelimit-remaining" in headers:
+            budget.limit = int(headers["x-ratelimit-limit"])
+            budget.remaining = int(headers["x-ratelimit-remaining"])
+            budget.reset = float(headers["x-ratelimit-reset"])
+
+        if status not in (403, 429):
+            return None
+
+        now = time.time()
+        secondary = status == 429 or b"secondary rate limit" in body.lower()
+        if "retry-after" in headers:
+            retry_after = float(headers["retry-after"])
+        elif budget.remaining == 0 and budget.reset > now:
+            retry_after = budget.reset - now
+        elif secondary:
+            retry_after = RATELIMIT_SECONDARY_DELAY
+        else:
+            return None
+
+        if secondary:
+            # secondary rate limit berlaku untuk semua resource installation ini
+            budgets = [
+                budget
+                for (installation, _), budget in self._budgets.items()
+                if installation == installation_id
+            ]
+        else:
+            budgets = [budget]
+        for blocked in budgets:
+            blocked.blocked_until = max(blocked.blocked_until, now + retry_after)
+        logger.warning(
+            "ratelimit blocked=%.1fs resource=%s secondary=%s installation=%s",
+            retry_after,
+            resource,
+            secondary,
+            installation_id,
+        )
+        return retry_after
+
+    def metrics(self) -> dict[tuple[int, str], dict[str, Any]]:
+        now = time.time()
+        return {
+            key: {
+                "limit": budget.limit,
+                "remaining": budget.remaining,
+                "reset_in": max(budget.reset - now, 0.0),
+                "deferred": budget.deferred,
+            }
+            for key, budget in self._budgets.items()
+        }
+
+
+scheduler = RateLimitScheduler()
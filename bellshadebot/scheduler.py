@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Coroutine, Hashable, Optional
+
+SCHEDULER_BACKOFF_BASE = float(os.environ.get("SCHEDULER_BACKOFF_BASE", "1"))
+SCHEDULER_BACKOFF_CAP = float(os.environ.get("SCHEDULER_BACKOFF_CAP", "60"))
+
+logger = logging.getLogger(__package__)
+
+
+def backoff(
+    attempt: int,
+    base: float = SCHEDULER_BACKOFF_BASE,
+    cap: float = SCHEDULER_BACKOFF_CAP,
+) -> float:
+    delay = min(cap, base * 2.0**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def untraced_task(coro: Coroutine[Any, Any, None]) -> asyncio.Task[None]:
+    # task yang hidup lebih lama dari delivery tidak boleh mewarisi span (context)
+    # delivery yang kebetulan membuatnya, trace itu sudah diekspor
+    return contextvars.Context().run(asyncio.create_task, coro)
+
+
+@dataclass(order=True)
+class ScheduledTask:
+    when: float
+    seq: int
+    key: Hashable = field(compare=False)
+    callback: Callable[[], Awaitable[None]] = field(compare=False, repr=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class TaskScheduler:
+    def __init__(self) -> None:
+        self._heap: list[ScheduledTask] = []
+        self._pending: dict[Hashable, ScheduledTask] = {}
+        self._running: set[asyncio.Task[None]] = set()
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task[None]] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    def schedule(
+        self, key: Hashable, delay: float, callback: Callable[[], Awaitable[None]]
+    ) -> None:
+        self.cancel(key)
+        loop = asyncio.get_running_loop()
+        task = ScheduledTask(loop.time() + delay, next(self._counter), key, callback)
+        self._pending[key] = task
+        heapq.heappush(self._heap, task)
+
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = untraced_task(self._run())
+        elif self._heap[0] is task:
+            assert self._wakeup is not None
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        task = self._pending.pop(key, None)
+        if task is None:
+            return False
+        task.cancelled = True
+        return True
+
+    async def close(self) -> None:
+        for task in self._pending.values():
+            task.cancelled = True
+        self._pending.clear()
+        self._heap.clear()
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+
+            timeout = self._heap[0].when - loop.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            task = heapq.heappop(self._heap)
+            del self._pending[task.key]
+            running = untraced_task(self._execute(task))
+            self._running.add(running)
+            running.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _execute(task: ScheduledTask) -> None:
+        try:
+            await task.callback()
+        except Exception as err:
+            logger.exception("scheduled task %s gagal: %s", task.key, err)
+
+
+task_scheduler = TaskScheduler()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+STATE_DB_PATH: Optional[str] = os.environ.get("STATE_DB_PATH")
+STATE_DB_TIMEOUT = float(os.environ.get("STATE_DB_TIMEOUT", "5"))
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path, timeout=STATE_DB_TIMEOUT, isolation_level=None, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SqliteStore:
+    def __init__(self, path: str, table: str) -> None:
+        self.table = table
+        self._conn = connect(path)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)"
+        )
+        # waktu akses dari get_raw, ditulis bersama write berikutnya
+        self._touched: dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self.get_raw(key)
+        return pickle.loads(data) if data is not None else None
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        row = self._conn.execute(
+            f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        # read tetap read-only supaya tidak berebut lock WAL dengan writer lain,
+        # accessed hanya dipakai evict
+        self._touched[key] = time.time()
+        data: bytes = row[0]
+        return data
+
+    def set(self, key: str, value: Any) -> int:
+        return self.set_raw(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def set_raw(self, key: str, data: bytes) -> int:
+        # untuk pemanggil yang sudah menyimpan bytes hasil pickle sendiri
+        self._touched.pop(key, None)
+        with self._transaction():
+            self._flush_touched()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed)"
+                " VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+        return len(data)
+
+    def delete(self, key: str) -> None:
+        self._touched.pop(key, None)
+        self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        for key, value in self._conn.execute(
+            f"SELECT key, value FROM {self.table}"
+        ).fetchall():
+            yield key, pickle.loads(value)
+
+    def total_size(self) -> int:
+        row = self._conn.execute(f"SELECT SUM(size) FROM {self.table}").fetchone()
+        return row[0] or 0
+
+    def evict(self, max_bytes: int) -> None:
+        with self._transaction():
+            self._flush_touched()
+        excess = self.total_size() - max_bytes
+        if excess <= 0:
+            return None
+
+        rows = self._conn.execute(
+            f"SELECT key, size FROM {self.table} ORDER BY accessed"
+        ).fetchall()
+        keys = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            keys.append((key,))
+            excess -= size
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", keys)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _flush_touched(self) -> None:
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in touched.items()],
+        )
+
+    def __len__(self) -> int:
+        count: int = self._conn.execute(
+            f"SELECT COUNT(*) FROM {self.table}"
+        ).fetchone()[0]
+        return count
+
+
+def open_store(table: str) -> Optional[SqliteStore]:
+    if STATE_DB_PATH is None:
+        return None
+    return SqliteStore(STATE_DB_PATH, table)
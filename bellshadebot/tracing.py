@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    ContextManager,
+    Iterator,
+    Mapping,
+    Optional,
+    TypeVar,
+    Union,
+    cast,
+)
+
+import sentry_sdk
+
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "").lower()
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.environ.get(
+    "TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+TRACE_OTLP_TIMEOUT = float(os.environ.get("TRACE_OTLP_TIMEOUT", "5"))
+TRACE_MAX_PENDING = int(os.environ.get("TRACE_MAX_PENDING", "100"))
+TRACE_SENTRY = os.environ.get("TRACE_SENTRY", "").lower() in ("1", "true", "yes")
+SERVICE_NAME: str = "bellshadebot"
+
+# kode status dan kind span OTLP
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+AsyncFunc = TypeVar("AsyncFunc", bound=Callable[..., Awaitable[Any]])
+
+logger = logging.getLogger(__package__)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    delivery_id: str
+    spans: list[Span] = field(default_factory=list)
+
+
+@dataclass
+class Span:
+    trace: Trace
+    name: str
+    parent_id: Optional[str]
+    kind: int = KIND_INTERNAL
+    attributes: dict[str, Any] = field(default_factory=dict)
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[16:])
+    start: int = field(default_factory=time.time_ns)
+    end: int = 0
+    error: Optional[str] = None
+    sentry: Any = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("bellshadebot_span", default=None)
+# dipakai ulang ketika delivery tidak disampling supaya hot path tidak membuat span
+NO_SPAN: ContextManager[None] = nullcontext()
+
+
+def trace_id_for(delivery_id: str) -> str:
+    try:
+        return uuid.UUID(delivery_id).hex
+    except ValueError:
+        return hashlib.md5(delivery_id.encode()).hexdigest()
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(trace: Trace) -> dict[str, Any]:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": otlp_value(SERVICE_NAME)}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": SERVICE_NAME},
+                        "spans": [
+                            {
+                                "traceId": trace.trace_id,
+                                "spanId": span.span_id,
+                                "parentSpanId": span.parent_id or "",
+                                "name": span.name,
+                                "kind": span.kind,
+                                "startTimeUnixNano": str(span.start),
+                                "endTimeUnixNano": str(span.end),
+                                "attributes": [
+                                    {"key": key, "value": otlp_value(value)}
+                                    for key, value in span.attributes.items()
+                                ],
+                                "status": (
+                                    {"code": STATUS_ERROR, "message": span.error}
+                                    if span.error is not None
+                                    else {"code": STATUS_UNSET}
+                                ),
+                            }
+                            for span in trace.spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class JsonFileExporter:
+    def __init__(self, path: str = TRACE_FILE) -> None:
+        self.path = path
+
+    def export(self, payload: dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OtlpHttpExporter:
+    def __init__(
+        self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = TRACE_OTLP_TIMEOUT
+    ) -> None:
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, payload: dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+Exporter = Union[JsonFileExporter, OtlpHttpExporter]
+
+EXPORTERS: dict[str, Callable[[], Exporter]] = {
+    "json": JsonFileExporter,
+    "otlp": OtlpHttpExporter,
+}
+
+
+class Tracer:
+    def __init__(
+        self,
+        exporter: Optional[Exporter] = None,
+        *,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        sentry: bool = TRACE_SENTRY,
+        max_pending: int = TRACE_MAX_PENDING,
+    ) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.sentry = sentry
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None or self.sentry
+
+    @contextmanager
+    def trace(
+        self, name: str, delivery_id: str, **attributes: Any
+    ) -> Iterator[Optional[Span]]:
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return None
+
+        trace = Trace(trace_id_for(delivery_id), delivery_id)
+        attributes["github.delivery_id"] = delivery_id
+        try:
+            with self._span(trace, None, name, KIND_SERVER, attributes) as span:
+                yield span
+        finally:
+            self._export(trace)
+
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Mapping[str, Any]] = None,
+        *,
+        kind: int = KIND_INTERNAL,
+        **extra: Any,
+    ) -> ContextManager[Optional[Span]]:
+        # atribut OTel memakai titik ("code.filepath"), jadi diberikan lewat mapping
+        parent = _current.get()
+        if parent is None:
+            return NO_SPAN
+        return self._span(
+            parent.trace, parent, name, kind, {**(attributes or {}), **extra}
+        )
+
+    def traced(self, name: Optional[str] = None) -> Callable[[AsyncFunc], AsyncFunc]:
+        def decorator(func: AsyncFunc) -> AsyncFunc:
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(span_name):
+                    return await func(*args, **kwargs)
+
+            return cast(AsyncFunc, wrapper)
+
+        return decorator
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @contextmanager
+    def _span(
+        self,
+        trace: Trace,
+        parent: Optional[Span],
+        name: str,
+        kind: int,
+        attributes: dict[str, Any],
+    ) -> Iterator[Span]:
+        span = Span(
+            trace,
+            name,
+            parent.span_id if parent is not None else None,
+            kind,
+            attributes,
+        )
+        if self.sentry:
+            if parent is None:
+                span.sentry = sentry_sdk.start_transaction(
+                    op="webhook", name=name, trace_id=trace.trace_id, sampled=True
+                )
+            elif parent.sentry is not None:
+                span.sentry = parent.sentry.start_child(op=name)
+
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = repr(err)
+            raise
+        finally:
+            span.end = time.time_ns()
+            _current.reset(token)
+            trace.spans.append(span)
+            if span.sentry is not None:
+                for key, value in span.attributes.items():
+                    span.sentry.set_data(key, value)
+                span.sentry.set_status("ok" if span.error is None else "internal_error")
+                span.sentry.finish()
+
+    def _export(self, trace: Trace) -> None:
+        if self.exporter is None:
+            return None
+        # ekspor dijalankan di thread supaya event loop tidak menunggu I/O
+        if not self._pending.acquire(blocking=False):
+            logger.warning("trace dibuang, antrian ekspor penuh: %s", trace.delivery_id)
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="tracing")
+        self._executor.submit(self._write, trace)
+
+    def _write(self, trace: Trace) -> None:
+        assert self.exporter is not None
+        try:
+            self.exporter.export(otlp_payload(trace))
+        except Exception as err:
+            logger.warning("gagal mengekspor trace %s: %s", trace.delivery_id, err)
+        finally:
+            self._pending.release()
+
+
+def create_tracer() -> Tracer:
+    factory = EXPORTERS.get(TRACE_EXPORTER)
+    if TRACE_EXPORTER and factory is None:
+        logger.warning("TRACE_EXPORTER tidak dikenal: %s", TRACE_EXPORTER)
+    return Tracer(factory() if factory is not None else None)
+
+
+tracer = create_tracer()
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-import urllib.parse
+import logging
 from base64 import b64decode
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Mapping, Optional, Union
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
+
+from gidgethub import GitHubException
 
 from bellshadebot.api import GitHubAPI
 from bellshadebot.constant import PR_REVIEW_BODY
+from bellshadebot.index import open_pr_counter, pr_index
+from bellshadebot.tracing import tracer
 
 
 @dataclass(frozen=True)
@@ -16,17 +22,76 @@ class File:
     path: Path
     contents_url: str
     status: str
+    sha: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CheckRun:
+    name: str
+    status: str
+    conclusion: Optional[str]
+
+
+@dataclass(frozen=True)
+class PullRequestSnapshot:
+    url: str
+    number: int
+    head_sha: str
+    state: str
+    draft: bool
+    mergeable: Optional[bool]
+    labels: tuple[str, ...]
+    check_runs: tuple[CheckRun, ...]
+
+
+PR_SNAPSHOT_QUERY = """
+query ($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      number
+      headRefOid
+      state
+      isDraft
+      mergeable
+      labels(first: 100) { nodes { name } }
+      commits(last: 1) {
+        nodes {
+          commit {
+            checkSuites(first: 50) {
+              nodes { checkRuns(first: 100) { nodes { name status conclusion } } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+MERGEABLE_STATE: dict[str, Optional[bool]] = {
+    "MERGEABLE": True,
+    "CONFLICTING": False,
+    "UNKNOWN": None,
+}
+
+_snapshots: WeakKeyDictionary[GitHubAPI, dict[str, PullRequestSnapshot]] = (
+    WeakKeyDictionary()
+)
+logger = logging.getLogger(__package__)
 
 
 async def get_pr_for_commit(
     gh: GitHubAPI, *, sha: str, repository: str
 ) -> Optional[Any]:
-    data = await gh.getitem(
-        f"/search/issues?q=type:pr+state:open+draft:fase+repo:{repository}+sha:{sha}",
+    if (pull_request := pr_index.get(repository, sha)) is not None:
+        return None if pull_request["draft"] else pull_request
+
+    async for pull_request in gh.getiter(
+        f"/repos/{repository}/commits/{sha}/pulls",
         oauth_token=await gh.access_token,
-    )
-    if data["total_count"] > 0:
-        return data["items"][0]
+    ):
+        if pull_request["state"] == "open" and pull_request["head"]["sha"] == sha:
+            pr_index.add(repository, pull_request)
+            return None if pull_request["draft"] else pull_request
 
     return None
 
@@ -42,16 +107,7 @@ async def get_check_runs_for_commit(gh: GitHubAPI, *, sha: str, repository: str)
 async def add_label_to_pr_or_issue(
     gh: GitHubAPI, *, label: Union[str, list[str]], pr_or_issue: Mapping[str, Any]
 ) -> None:
-    labels_url = (
-        pr_or_issue["labels_url"]
-        if "labels_url" in pr_or_issue
-        else pr_or_issue["issue_url"] + "/labels"
-    )
-    await gh.post(
-        labels_url,
-        data={"labels": [label] if isinstance(label, str) else label},
-        oauth_token=await gh.access_token,
-    )
+    gh.labels.add(pr_or_issue, [label] if isinstance(label, str) else label)
 
 
 async def remove_label_from_pr_or_issue(
@@ -60,30 +116,15 @@ async def remove_label_from_pr_or_issue(
     label: Union[str, list[str]],
     pr_or_issue: Mapping[str, Any],
 ) -> None:
-    labels_url = (
-        pr_or_issue["labels_url"]
-        if "labels_url" in pr_or_issue
-        else pr_or_issue["issue_url"] + "/labels"
-    )
-    label_list = [label] if isinstance(label, str) else label
-    for label in label_list:
-        parse_label = urllib.parse.quote(label)
-        await gh.delete(
-            f"{labels_url}/{parse_label}",
-            oauth_token=await gh.access_token,
-        )
+    gh.labels.remove(pr_or_issue, [label] if isinstance(label, str) else label)
 
 
 async def get_user_open_pr_numbers(
     gh: GitHubAPI, *, user_login: str, repository: str
-) -> list[str]:
-    search_url = (
-        f"/search/issues?q=type:pr+state:open+repo:{repository}+author:{user_login}"
+) -> list[int]:
+    return await open_pr_counter.open_pr_numbers(
+        gh, repository=repository, user_login=user_login
     )
-    pr_numbers = []
-    async for pull in gh.getiter(search_url, oauth_token=await gh.access_token):
-        pr_numbers.append(pull["number"])
-    return pr_numbers
 
 
 async def add_comment_to_pr_or_issue(
@@ -111,6 +152,7 @@ async def close_pr_or_issue(
         data={"state": "closed"},
         oauth_token=await gh.access_token,
     )
+    _snapshots.get(gh, {}).pop(pr_or_issue["url"], None)
     try:
         if pr_or_issue["requested_reviewers"]:
             await remove_requested_reviewers_from_pr(gh, pull_request=pr_or_issue)
@@ -132,6 +174,7 @@ async def remove_requested_reviewers_from_pr(
     )
 
 
+@tracer.traced()
 async def get_pr_files(gh: GitHubAPI, *, pull_request: Mapping[str, Any]) -> list[File]:
     files = []
     async for data in gh.getiter(
@@ -143,11 +186,13 @@ async def get_pr_files(gh: GitHubAPI, *, pull_request: Mapping[str, Any]) -> lis
                 Path(data["filename"]),
                 data["contents_url"],
                 data["status"],
+                data.get("sha"),
             )
         )
     return files
 
 
+@tracer.traced()
 async def get_file_content(gh: GitHubAPI, *, file: File) -> bytes:
     data = await gh.getitem(
         file.contents_url,
@@ -156,6 +201,7 @@ async def get_file_content(gh: GitHubAPI, *, file: File) -> bytes:
     return b64decode(data["content"])
 
 
+@tracer.traced()
 async def create_pr_review(
     gh: GitHubAPI, *, pull_request: Mapping[str, Any], comments: list[dict[str, Any]]
 ) -> None:
@@ -190,4 +236,80 @@ async def get_pr_for_issue(gh: GitHubAPI, *, issue: Mapping[str, Any]) -> Any:
 
 
 async def update_pr(gh: GitHubAPI, *, pull_request: Mapping[str, Any]) -> Any:
+    gh.forget(pull_request["url"])
     return await gh.getitem(pull_request["url"], oauth_token=await gh.access_token)
+
+
+@tracer.traced()
+async def get_pr_snapshot(
+    gh: GitHubAPI, *, pull_request: Mapping[str, Any]
+) -> PullRequestSnapshot:
+    snapshots = _snapshots.setdefault(gh, {})
+    snapshot = snapshots.get(pull_request["url"])
+    if snapshot is None:
+        try:
+            snapshot = await _query_pr_snapshot(gh, pull_request=pull_request)
+        except (GitHubException, KeyError, TypeError) as err:
+            # pullRequest bernilai null kalau PR tidak terlihat oleh token installation
+            logger.warning("graphql snapshot gagal, fallback ke REST: %r", err)
+            snapshot = await _rest_pr_snapshot(gh, pull_request=pull_request)
+        snapshots[pull_request["url"]] = snapshot
+    return snapshot
+
+
+async def _query_pr_snapshot(
+    gh: GitHubAPI, *, pull_request: Mapping[str, Any]
+) -> PullRequestSnapshot:
+    _, _, owner, name, _, number = urlsplit(pull_request["url"]).path.split("/")
+    data = await gh.graphql(
+        PR_SNAPSHOT_QUERY,
+        endpoint=f"{gh.base_url}/graphql",
+        owner=owner,
+        name=name,
+        number=int(number),
+    )
+    pr_data = data["repository"]["pullRequest"]
+    check_runs = [
+        CheckRun(
+            run["name"],
+            run["status"].lower(),
+            run["conclusion"].lower() if run["conclusion"] else None,
+        )
+        for commit in pr_data["commits"]["nodes"]
+        for suite in commit["commit"]["checkSuites"]["nodes"]
+        for run in suite["checkRuns"]["nodes"]
+    ]
+    return PullRequestSnapshot(
+        url=pull_request["url"],
+        number=pr_data["number"],
+        head_sha=pr_data["headRefOid"],
+        state="open" if pr_data["state"] == "OPEN" else "closed",
+        draft=pr_data["isDraft"],
+        mergeable=MERGEABLE_STATE.get(pr_data["mergeable"]),
+        labels=tuple(label["name"] for label in pr_data["labels"]["nodes"]),
+        check_runs=tuple(check_runs),
+    )
+
+
+async def _rest_pr_snapshot(
+    gh: GitHubAPI, *, pull_request: Mapping[str, Any]
+) -> PullRequestSnapshot:
+    pr_data = await update_pr(gh, pull_request=pull_request)
+    repository = pr_data["base"]["repo"]["full_name"]
+    head_sha = pr_data["head"]["sha"]
+    check_runs = await get_check_runs_for_commit(
+        gh, sha=head_sha, repository=repository
+    )
+    return PullRequestSnapshot(
+        url=pull_request["url"],
+        number=pr_data["number"],
+        head_sha=head_sha,
+        state=pr_data["state"],
+        draft=pr_data["draft"],
+        mergeable=pr_data["mergeable"],
+        labels=tuple(label["name"] for label in pr_data["labels"]),
+        check_runs=tuple(
+            CheckRun(run["name"], run["status"], run["conclusion"])
+            for run in check_runs["check_runs"]
+        ),
+    )
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Hashable, Iterable, MutableMapping, Optional
+
+from aiohttp import ClientSession
+from gidgethub.sansio import Event
+
+from bellshadebot.api import GitHubAPI
+from bellshadebot.cache import ResponseCache
+from bellshadebot.dispatch import dispatch, event_key
+from bellshadebot.event import main_router
+from bellshadebot.event.pull_request import is_open_and_valid, review_pipelines
+from bellshadebot.index import pr_index
+from bellshadebot.jobqueue import JOB_POLL_INTERVAL, JobQueue
+from bellshadebot.metrics import EVENT_DURATION
+from bellshadebot.ratelimit import scheduler
+from bellshadebot.tracing import tracer
+
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", "4"))
+WORKER_MAX_IN_FLIGHT = int(os.environ.get("WORKER_MAX_IN_FLIGHT", "4"))
+WORKER_QUEUE_SIZE = int(os.environ.get("WORKER_QUEUE_SIZE", "100"))
+WORKER_SHUTDOWN_TIMEOUT = float(os.environ.get("WORKER_SHUTDOWN_TIMEOUT", "10"))
+
+logger = logging.getLogger(__package__)
+
+
+def is_synchronize(event: Event) -> bool:
+    return event.event == "pull_request" and event.data["action"] == "synchronize"
+
+
+class EventWorkerPool:
+    def __init__(
+        self,
+        session: ClientSession,
+        *,
+        cache: Optional[MutableMapping[Any, Any]] = None,
+        workers: int = WORKER_COUNT,
+        max_in_flight: int = WORKER_MAX_IN_FLIGHT,
+        queue_size: int = WORKER_QUEUE_SIZE,
+        jobs: Optional[JobQueue] = None,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ) -> None:
+        self._session = session
+        self._cache = cache
+        self._jobs = jobs
+        self._poll_interval = poll_interval
+        self._leased: set[int] = set()
+        self._completed: dict[int, set[str]] = {}
+        self._finishing: set[asyncio.Future[None]] = set()
+        self._poller: Optional[asyncio.Task[None]] = None
+        self._worker_count = workers
+        self._queue_size = queue_size
+        self._queue: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._actors: dict[Hashable, deque[tuple[Event, Optional[int]]]] = {}
+        self._pending = 0
+        self._unordered = itertools.count()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._workers: list[asyncio.Task[None]] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        for _ in range(self._worker_count):
+            self._workers.append(asyncio.create_task(self._worker()))
+        if self._jobs is not None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self, timeout: float = WORKER_SHUTDOWN_TIMEOUT) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("worker shutdown: %s event(s) dropped", self.queue_depth)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        if self._jobs is not None:
+            for job_id in self._leased:
+                await self._jobs.release(job_id, self._completed.pop(job_id, ()))
+            self._leased.clear()
+
+    def submit(
+        self,
+        event: Event,
+        job_id: Optional[int] = None,
+        completed: Iterable[str] = (),
+    ) -> bool:
+        if self._pending >= self._queue_size:
+            logger.warning(
+                "queue penuh, event ditolak: delivery_id=%s", event.delivery_id
+            )
+            return False
+
+        key = event_key(event)
+        if key is None:
+            key = ("unordered", next(self._unordered))
+        # event synchronize lama (datang terlambat atau retry) tidak menggantikan
+        # event yang lebih baru di mailbox
+        if is_synchronize(event):
+            review_pipelines.cancel_superseded(event.data["pull_request"])
+        latest = is_synchronize(event) and review_pipelines.is_latest(
+            event.data["pull_request"]
+        )
+
+        self._pending += 1
+        if job_id is not None:
+            self._leased.add(job_id)
+            self._completed[job_id] = set(completed)
+        if key in self._actors:
+            mailbox = self._actors[key]
+            if latest:
+                for queued in [item for item in mailbox if is_synchronize(item[0])]:
+                    mailbox.remove(queued)
+                    self._pending -= 1
+                    logger.info(
+                        "event digabung: delivery_id=%s => %s",
+                        queued[0].delivery_id,
+                        event.delivery_id,
+                    )
+                    if queued[1] is not None:
+                        finishing = asyncio.ensure_future(self._finish(queued[1], None))
+                        self._finishing.add(finishing)
+                        finishing.add_done_callback(self._finishing.discard)
+            mailbox.append((event, job_id))
+        else:
+            self._actors[key] = deque([(event, job_id)])
+            self._queue.put_nowait(key)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            mailbox = self._actors[key]
+            try:
+                event, job_id = mailbox.popleft()
+                self._pending -= 1
+                try:
+                    async with self._in_flight:
+                        await self._process(
+                            event,
+                            self._completed.get(job_id) if job_id is not None else None,
+                        )
+                except Exception as err:
+                    logger.exception(err)
+                    await self._finish(job_id, err)
+                else:
+                    await self._finish(job_id, None)
+            finally:
+                if mailbox:
+                    self._queue.put_nowait(key)
+                else:
+                    del self._actors[key]
+                self._queue.task_done()
+
+    async def _finish(self, job_id: Optional[int], error: Optional[Exception]) -> None:
+        if job_id is None or self._jobs is None:
+            return None
+
+        self._leased.discard(job_id)
+        completed = self._completed.pop(job_id, set())
+        try:
+            if error is None:
+                await self._jobs.complete([job_id])
+            else:
+                await self._jobs.fail(job_id, error, completed)
+        except Exception as err:
+            logger.exception("job %s gagal diperbarui: %s", job_id, err)
+
+    async def _poll(self) -> None:
+        assert self._jobs is not None
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                if self._leased:
+                    await self._jobs.renew(list(self._leased))
+                free = self._queue_size - self._pending
+                if free > 0:
+                    for job in await self._jobs.lease_due(free):
+                        logger.info(
+                            "job diambil dari queue: delivery_id=%s attempts=%s",
+                            job.event.delivery_id,
+                            job.attempts,
+                        )
+                        self.submit(job.event, job.id, job.completed)
+            except Exception as err:
+                logger.exception(err)
+
+    async def _process(
+        self, event: Event, completed: Optional[set[str]] = None
+    ) -> None:
+        installation = event.data.get("installation")
+        if installation is None:
+            # contoh: ping atau event level app, tidak ada token untuk dipakai
+            logger.info(
+                "event tanpa installation dilewati: event=%s delivery_id=%s",
+                event.event,
+                event.delivery_id,
+            )
+            return None
+
+        gh = GitHubAPI(
+            installation["id"],
+            self._session,
+            "arfyslowy/bellshadebot",
+            cache=self._cache,
+            base_url=GITHUB_API_URL,
+        )
+        name = f"{event.event}:{event.data.get('action', '')}"
+        start = time.perf_counter()
+        with tracer.trace(
+            name,
+            event.delivery_id,
+            **{
+                "github.event": event.event,
+                "github.installation_id": gh.installation_id,
+            },
+        ):
+            try:
+                await dispatch(
+                    main_router,
+                    event,
+                    gh,
+                    completed=completed,
+                    recheck=functools.partial(is_open_and_valid, gh, event),
+                )
+            finally:
+                with tracer.span("labels.apply"):
+                    await gh.labels.apply(gh)
+                EVENT_DURATION.observe(time.perf_counter() - start, name)
+
+        if gh.rate_limit is not None:  # pragma: no cover
+            logger.info(
+                "ratelimit=%s, time_remaining=%s, deferred=%s",
+                f"{gh.rate_limit.remaining}/{gh.rate_limit.limit}",
+                gh.rate_limit.reset_datetime - datetime.now(timezone.utc),
+                scheduler.deferred(gh.installation_id),
+            )
+        logger.info(
+            "deduplicated=%s delivery_id=%s", gh.deduplicated, event.delivery_id
+        )
+        if isinstance(self._cache, ResponseCache):
+            logger.info("cache=%s", self._cache.stats())
+        logger.info("pr_index=%s", pr_index.stats())
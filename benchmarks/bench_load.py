@@ -0,0 +1,251 @@
+"""
+load test event/detik bellshadebot untuk beberapa jumlah web worker
+
+    python -m benchmarks.bench_load --workers 1 2 4 --events 200 --files 5
+
+setiap jumlah worker menjalankan ``python -m bellshadebot`` dengan
+BELLSHADEBOT_PROCESSES yang sesuai, mengarahkan GITHUB_API_URL ke fake GitHub
+server lokal, lalu mengirim event ``pull_request synchronize`` bertanda tangan untuk
+pull request yang berbeda. waktu dihitung sampai semua review terkirim.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable
+
+from aiohttp import ClientSession, web
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+REPOSITORY = "bellshade/Python"
+SECRET = "bench"
+ADMIN_TOKEN = "bench"
+SOURCE = "\n\n".join(
+    f"def fungsi_{i}(angka, nilai):\n"
+    f"    hasil = angka + nilai * {i}\n"
+    "    return hasil\n"
+    for i in range(40)
+)
+
+
+class FakeGitHub:
+    def __init__(self, files: int) -> None:
+        self.files = files
+        self.reviews = 0
+        self.requests = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.count])
+        repo = f"/repos/{REPOSITORY}"
+        app.router.add_post("/app/installations/{id}/access_tokens", self.token)
+        app.router.add_post("/graphql", self.graphql)
+        app.router.add_get(repo + "/pulls/{number}/files", self.pr_files)
+        app.router.add_get(repo + "/contents/{path:.+}", self.contents)
+        app.router.add_post(repo + "/pulls/{number}/reviews", self.review)
+        app.router.add_get(repo + "/issues/{number}/labels", self.labels)
+        app.router.add_put(repo + "/issues/{number}/labels", self.labels)
+        return app
+
+    @web.middleware
+    async def count(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        self.requests += 1
+        return await handler(request)
+
+    async def token(self, request: web.Request) -> web.Response:
+        return web.json_response({"token": "token"}, status=201)
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        # snapshot PR dipakai recheck dispatch, file diambil dari pr_files
+        variables = (await request.json())["variables"]
+        pull_request = {
+            "number": variables["number"],
+            "headRefOid": "0" * 40,
+            "state": "OPEN",
+            "isDraft": False,
+            "mergeable": "MERGEABLE",
+            "labels": {"nodes": []},
+            "commits": {"nodes": []},
+        }
+        return web.json_response(
+            {"data": {"repository": {"pullRequest": pull_request}}}
+        )
+
+    async def pr_files(self, request: web.Request) -> web.Response:
+        number = request.match_info["number"]
+        base = f"{request.url.origin()}/repos/{REPOSITORY}"
+        return web.json_response(
+            [
+                {
+                    "filename": f"pr_{number}/file_{i}.py",
+                    "sha": hashlib.sha1(f"{number}:{i}".encode()).hexdigest(),
+                    "status": "added",
+                    "contents_url": f"{base}/contents/pr_{number}/file_{i}.py",
+                }
+                for i in range(self.files)
+            ]
+        )
+
+    async def contents(self, request: web.Request) -> web.Response:
+        content = base64.b64encode(SOURCE.encode()).decode()
+        return web.json_response({"content": content})
+
+    async def review(self, request: web.Request) -> web.Response:
+        self.reviews += 1
+        if self.reviews >= self.expected:
+            self.done.set()
+        return web.json_response({}, status=200)
+
+    async def labels(self, request: web.Request) -> web.Response:
+        return web.json_response([])
+
+
+def synchronize_event(base_url: str, number: int, run: int) -> dict[str, Any]:
+    pr_url = f"{base_url}/repos/{REPOSITORY}/pulls/{number}"
+    return {
+        "action": "synchronize",
+        "before": "0" * 40,
+        "installation": {"id": 1},
+        "repository": {"full_name": REPOSITORY},
+        "pull_request": {
+            "number": number,
+            "url": pr_url,
+            "html_url": pr_url,
+            "issue_url": f"{base_url}/repos/{REPOSITORY}/issues/{number}",
+            "comments_url": f"{base_url}/repos/{REPOSITORY}/issues/{number}/comments",
+            "state": "open",
+            "draft": False,
+            "mergeable": True,
+            "labels": [],
+            "head": {"sha": hashlib.sha1(f"{run}:{number}".encode()).hexdigest()},
+            "user": {"login": f"kontributor{number}"},
+        },
+    }
+
+
+async def send_events(port: int, base_url: str, events: int, run: int) -> None:
+    async with ClientSession() as session:
+
+        async def send(number: int) -> None:
+            body = json.dumps(synchronize_event(base_url, number, run)).encode()
+            signature = hmac.new(SECRET.encode(), body, hashlib.sha1).hexdigest()
+            async with session.post(
+                f"http://127.0.0.1:{port}/",
+                data=body,
+                headers={
+                    "content-type": "application/json",
+                    "x-github-event": "pull_request",
+                    "x-github-delivery": f"{run}-{number}",
+                    "x-hub-signature": f"sha1={signature}",
+                },
+            ) as response:
+                assert response.status == 202, await response.text()
+
+        await asyncio.gather(*(send(number) for number in range(1, events + 1)))
+
+
+async def wait_until_ready(port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(
+                    f"http://127.0.0.1:{port}/admin/queue",
+                    headers={"Authorization": f"Bearer {ADMIN_TOKEN}"},
+                ) as response:
+                    if response.status == 200:
+                        return None
+            except OSError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError("bellshadebot tidak siap")
+
+
+async def run(args: argparse.Namespace) -> None:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+    fake = FakeGitHub(args.files)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    print(f"{args.events} event, {args.files} file/pr, {os.cpu_count()} cpu")
+    print(f"{'workers':<10}{'detik':>10}{'event/detik':>14}{'api call':>10}")
+    for run_index, workers in enumerate(args.workers):
+        with tempfile.TemporaryDirectory() as state_dir:
+            env = {
+                **os.environ,
+                "PORT": str(args.port),
+                "BELLSHADEBOT_PROCESSES": str(workers),
+                # setiap event untuk PR yang berbeda, state per proses tidak dipakai
+                "BELLSHADEBOT_PROCESSES_UNSAFE": "1",
+                "GITHUB_API_URL": base_url,
+                "GITHUB_SECRET": SECRET,
+                "ADMIN_TOKEN": ADMIN_TOKEN,
+                "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+                "LINT_WORKERS": str(args.lint_workers),
+                "LOG_LEVEL": "WARNING",
+                "bellshade testing github app id": "1",
+                "bellshade testing privatekey": private_key,
+                "PYTHONPATH": os.pathsep.join(
+                    filter(None, (os.getcwd(), os.environ.get("PYTHONPATH")))
+                ),
+            }
+            server = subprocess.Popen(
+                [sys.executable, "-m", "bellshadebot"], env=env, cwd=state_dir
+            )
+            try:
+                await wait_until_ready(args.port)
+                fake.reviews = fake.requests = 0
+                fake.expected = args.events
+                fake.done.clear()
+                start = time.perf_counter()
+                await send_events(args.port, base_url, args.events, run_index)
+                await asyncio.wait_for(fake.done.wait(), args.timeout)
+                elapsed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.wait()
+        print(
+            f"{workers:<10}{elapsed:>10.2f}{args.events / elapsed:>14.1f}"
+            f"{fake.requests / args.events:>10.1f}"
+        )
+    await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--lint-workers", type=int, default=0)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--timeout", type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+benchmark biaya traversal CST per rule lint
+
+    python -m benchmarks.bench_rules path/ke/bellshade/Python --repeat 5
+
+"before" me-resolve metadata provider secara eager seperti sebelumnya
+(NamingConventionRule mendeklarasikan QualifiedNameProvider), "after"
+menggunakan rule apa adanya (metadata di-resolve saat dibutuhkan).
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+from typing import Collection, Iterable, Type
+
+import libcst as cst
+from fixit import CstLintRule
+from fixit.rule_lint_engine import lint_file
+from libcst.metadata import MetadataWrapper, ProviderT, QualifiedNameProvider
+
+from bellshadebot.parser.registry import DEFAULT_CONFIG, get_rule_registry
+
+EAGER_METADATA: dict[str, tuple[ProviderT, ...]] = {
+    "NamingConventionRule": (QualifiedNameProvider,),
+}
+
+Corpus = list[tuple[Path, bytes, cst.Module]]
+
+
+def load_corpus(paths: Iterable[Path]) -> Corpus:
+    corpus = []
+    for root in paths:
+        files = [root] if root.is_file() else sorted(root.rglob("*.py"))
+        for filepath in files:
+            source = filepath.read_bytes()
+            try:
+                corpus.append((filepath, source, cst.parse_module(source)))
+            except cst.ParserSyntaxError:
+                continue
+    return corpus
+
+
+def traverse(
+    corpus: Corpus, rules: Collection[Type[CstLintRule]], eager: bool
+) -> float:
+    providers: set[ProviderT] = set()
+    if eager:
+        for rule in rules:
+            providers.update(EAGER_METADATA.get(rule.__name__, ()))
+
+    elapsed = 0.0
+    for filepath, source, module in corpus:
+        start = time.perf_counter()
+        wrapper = MetadataWrapper(module, unsafe_skip_copy=True)
+        if providers:
+            wrapper.resolve_many(providers)
+        lint_file(
+            filepath,
+            source,
+            use_ignore_byte_markers=False,
+            use_ignore_comments=False,
+            config=DEFAULT_CONFIG,
+            rules=set(rules),
+            cst_wrapper=wrapper,
+        )
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def measure(
+    corpus: Corpus, rules: Collection[Type[CstLintRule]], eager: bool, repeat: int
+) -> float:
+    return statistics.median(traverse(corpus, rules, eager) for _ in range(repeat))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("paths", nargs="+", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corpus = load_corpus(args.paths)
+    parse_time = time.perf_counter() - start
+    rules = sorted(get_rule_registry().rules, key=lambda rule: rule.__name__)
+
+    print(f"{len(corpus)} file, parse {parse_time * 1000:.1f}ms")
+    print(f"{'rule':<34}{'before (ms)':>14}{'after (ms)':>14}")
+    before_total = after_total = 0.0
+    for rule in rules:
+        before = measure(corpus, [rule], True, args.repeat)
+        after = measure(corpus, [rule], False, args.repeat)
+        before_total += before
+        after_total += after
+        print(f"{rule.__name__:<34}{before * 1000:>14.1f}{after * 1000:>14.1f}")
+
+    print(
+        f"{'semua rule, traversal per rule':<34}"
+        f"{before_total * 1000:>14.1f}{after_total * 1000:>14.1f}"
+    )
+    before = measure(corpus, rules, True, args.repeat)
+    after = measure(corpus, rules, False, args.repeat)
+    print(
+        f"{'semua rule, satu traversal':<34}{before * 1000:>14.1f}{after * 1000:>14.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
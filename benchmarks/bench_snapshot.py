@@ -0,0 +1,197 @@
+"""
+benchmark round-trip snapshot pull request terhadap fake GitHub server lokal
+
+    python -m benchmarks.bench_snapshot --events 50 --files 60 --latency 50
+
+"rest" menyusun snapshot dari endpoint REST (pull request dan check runs),
+"graphql" memakai satu query GraphQL, dan "files" adalah daftar file REST
+per 30 item yang dipakai review untuk blob SHA.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Awaitable, Callable
+
+from aiohttp import ClientSession, web
+
+from bellshadebot import utils
+from bellshadebot.api import GitHubAPI
+
+OWNER, NAME, NUMBER, HEAD_SHA = "bellshade", "Python", 1, "a" * 40
+REST_PAGE_SIZE = 30
+
+
+class FakeGitHub:
+    def __init__(self, files: int, check_runs: int, latency: float) -> None:
+        self.files = [f"folder/file_{i}.py" for i in range(files)]
+        self.check_runs = [f"job {i}" for i in range(check_runs)]
+        self.latency = latency
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.count])
+        repo = f"/repos/{OWNER}/{NAME}"
+        app.router.add_get(f"{repo}/pulls/{NUMBER}", self.pull_request)
+        app.router.add_get(f"{repo}/pulls/{NUMBER}/files", self.pr_files)
+        app.router.add_get(f"{repo}/commits/{HEAD_SHA}/check-runs", self.runs)
+        app.router.add_post("/graphql", self.graphql)
+        return app
+
+    @web.middleware
+    async def count(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def pull_request(self, request: web.Request) -> web.Response:
+        base = f"{request.url.origin()}/repos/{OWNER}/{NAME}"
+        return web.json_response(
+            {
+                "url": f"{base}/pulls/{NUMBER}",
+                "issue_url": f"{base}/issues/{NUMBER}",
+                "number": NUMBER,
+                "state": "open",
+                "draft": False,
+                "mergeable": True,
+                "labels": [{"name": "awaiting reviews"}],
+                "head": {"sha": HEAD_SHA},
+                "base": {"repo": {"full_name": f"{OWNER}/{NAME}"}},
+            }
+        )
+
+    async def pr_files(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", "1"))
+        start = (page - 1) * REST_PAGE_SIZE
+        end = start + REST_PAGE_SIZE
+        headers = {}
+        if end < len(self.files):
+            headers["Link"] = f'<{request.url.with_query(page=page + 1)}>; rel="next"'
+        base = f"{request.url.origin()}/repos/{OWNER}/{NAME}"
+        return web.json_response(
+            [
+                {
+                    "filename": path,
+                    "sha": f"{i:040x}",
+                    "status": "added",
+                    "contents_url": f"{base}/contents/{path}?ref={HEAD_SHA}",
+                }
+                for i, path in enumerate(self.files[start:end], start)
+            ],
+            headers=headers,
+        )
+
+    async def runs(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "check_runs": [
+                    {"name": name, "status": "completed", "conclusion": "success"}
+                    for name in self.check_runs
+                ]
+            }
+        )
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        pull_request = {
+            "number": NUMBER,
+            "headRefOid": HEAD_SHA,
+            "state": "OPEN",
+            "isDraft": False,
+            "mergeable": "MERGEABLE",
+            "labels": {"nodes": [{"name": "awaiting reviews"}]},
+            "commits": {
+                "nodes": [
+                    {
+                        "commit": {
+                            "checkSuites": {
+                                "nodes": [
+                                    {
+                                        "checkRuns": {
+                                            "nodes": [
+                                                {
+                                                    "name": name,
+                                                    "status": "COMPLETED",
+                                                    "conclusion": "SUCCESS",
+                                                }
+                                                for name in self.check_runs
+                                            ]
+                                        }
+                                    }
+                                ]
+                            }
+                        }
+                    }
+                ]
+            },
+        }
+        return web.json_response(
+            {"data": {"repository": {"pullRequest": pull_request}}}
+        )
+
+
+class BenchGitHubAPI(GitHubAPI):
+    @property
+    async def access_token(self) -> str:
+        return "token"
+
+
+Fetch = Callable[[GitHubAPI, dict[str, Any]], Awaitable[object]]
+
+MODES: dict[str, Fetch] = {
+    "rest": lambda gh, pr: utils._rest_pr_snapshot(gh, pull_request=pr),
+    "graphql": lambda gh, pr: utils.get_pr_snapshot(gh, pull_request=pr),
+    "files": lambda gh, pr: utils.get_pr_files(gh, pull_request=pr),
+}
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake = FakeGitHub(args.files, args.check_runs, args.latency / 1000)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base_url = f"http://127.0.0.1:{port}"
+    pull_request = {"url": f"{base_url}/repos/{OWNER}/{NAME}/pulls/{NUMBER}"}
+
+    print(
+        f"{args.events} event, {args.files} file, {args.check_runs} check run,"
+        f" latency {args.latency:.0f}ms"
+    )
+    print(f"{'mode':<16}{'round-trip/event':>18}{'median (ms)':>14}")
+    async with ClientSession() as session:
+        for mode, fetch in MODES.items():
+            fake.requests = 0
+            timings = []
+            for installation_id in range(args.events):
+                gh = BenchGitHubAPI(
+                    installation_id, session, "bench", base_url=base_url
+                )
+                start = time.perf_counter()
+                await fetch(gh, pull_request)
+                timings.append(time.perf_counter() - start)
+            print(
+                f"{mode:<16}{fake.requests / args.events:>18.1f}"
+                f"{statistics.median(timings) * 1000:>14.1f}"
+            )
+    await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--files", type=int, default=60)
+    parser.add_argument("--check-runs", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=50, help="ms per request")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+from gidgethub.routing import Router
+from gidgethub.sansio import Event
+
+from bellshadebot.dispatch import dispatch, handler_name, runs_after
+
+
+def event() -> Event:
+    return Event(
+        {"action": "opened", "pull_request": {"number": 1}},
+        event="pull_request",
+        delivery_id="delivery-1",
+    )
+
+
+@pytest.mark.asyncio
+async def test_dependent_skipped_when_dependency_fails() -> None:
+    router = Router()
+    calls: list[str] = []
+
+    @router.register("pull_request", action="opened")
+    async def close_invalid(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("close_invalid")
+        raise RuntimeError("gagal")
+
+    @router.register("pull_request", action="opened")
+    @runs_after(close_invalid)
+    async def review(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("review")
+
+    @router.register("pull_request", action="opened")
+    async def label(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("label")
+
+    completed: set[str] = set()
+    with pytest.raises(RuntimeError, match="gagal"):
+        await dispatch(router, event(), completed=completed)
+
+    assert sorted(calls) == ["close_invalid", "label"]
+    assert completed == {handler_name(label)}
+
+
+@pytest.mark.asyncio
+async def test_dependent_skipped_when_recheck_fails() -> None:
+    router = Router()
+    calls: list[str] = []
+
+    @router.register("pull_request", action="opened")
+    async def close_invalid(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("close_invalid")
+
+    @router.register("pull_request", action="opened")
+    @runs_after(close_invalid)
+    async def review(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("review")
+
+    async def closed() -> bool:
+        return False
+
+    await dispatch(router, event(), recheck=closed)
+    assert calls == ["close_invalid"]
+
+
+@pytest.mark.asyncio
+async def test_completed_handlers_not_rerun_on_retry() -> None:
+    router = Router()
+    calls: list[str] = []
+
+    @router.register("pull_request", action="opened")
+    async def comment(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("comment")
+
+    @router.register("pull_request", action="opened")
+    async def label(event: Event, *args: Any, **kwargs: Any) -> None:
+        calls.append("label")
+
+    completed = {handler_name(comment)}
+    await dispatch(router, event(), completed=completed)
+    assert calls == ["label"]
+    assert completed == {handler_name(comment), handler_name(label)}
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+import pytest
+from gidgethub.sansio import Event
+
+from bellshadebot import jobqueue
+from bellshadebot.jobqueue import JobQueue
+
+
+def event(delivery_id: str = "delivery-1") -> Event:
+    return Event(
+        {"action": "opened", "pull_request": {"number": 1}},
+        event="pull_request",
+        delivery_id=delivery_id,
+    )
+
+
+@pytest.mark.asyncio
+async def test_enqueue_ignores_duplicate_delivery(tmp_path: Path) -> None:
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    try:
+        first = await jobs.enqueue(event())
+        # GitHub mengirim ulang delivery yang sama saat redeliver
+        assert await jobs.enqueue(event()) is None
+        assert first is not None
+        assert await jobs.enqueue(event("delivery-2")) not in (None, first)
+        assert (await jobs.stats())["jobs"]["leased"] == 2
+    finally:
+        await jobs.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_redelivered(tmp_path: Path) -> None:
+    path = str(tmp_path / "jobs.db")
+    crashed = JobQueue(path, lease_timeout=0.1)
+    job_id = await crashed.enqueue(event())
+    await crashed.close()
+
+    jobs = JobQueue(path, lease_timeout=60)
+    try:
+        # lease proses yang mati belum habis
+        assert await jobs.lease_due(10) == []
+        await asyncio.sleep(0.15)
+        [job] = await jobs.lease_due(10)
+        assert job.id == job_id
+        assert job.event.delivery_id == "delivery-1"
+        assert job.event.data["pull_request"]["number"] == 1
+        # sudah di-lease ulang oleh proses ini, tidak diambil dua kali
+        assert await jobs.lease_due(10) == []
+    finally:
+        await jobs.close()
+
+
+@pytest.mark.asyncio
+async def test_released_job_keeps_completed_handlers(tmp_path: Path) -> None:
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    try:
+        job_id = await jobs.enqueue(event())
+        assert job_id is not None
+        await jobs.release(job_id, {"handler.b", "handler.a"})
+        [job] = await jobs.lease_due(10)
+        assert job.completed == frozenset({"handler.a", "handler.b"})
+        await jobs.complete([job.id])
+        assert (await jobs.stats())["jobs"]["leased"] == 0
+    finally:
+        await jobs.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_then_dead_lettered(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(jobqueue, "JOB_RETRY_BASE", 0.0)
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    try:
+        job_id = await jobs.enqueue(event())
+        assert job_id is not None
+        await jobs.fail(job_id, RuntimeError("pertama"))
+        [job] = await jobs.lease_due(10)
+        assert job.attempts == 1
+        await jobs.fail(job.id, RuntimeError("kedua"))
+
+        stats = await jobs.stats()
+        assert stats["jobs"] == {"queued": 0, "leased": 0, "retry": 0}
+        assert stats["dead_letter"] == 1
+        assert stats["recent_dead_letters"][0]["error"] == "RuntimeError('kedua')"
+    finally:
+        await jobs.close()
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from bellshadebot.event.pull_request import ReviewPipelines
+
+
+def pull_request(head_sha: str, updated_at: str) -> dict[str, Any]:
+    return {
+        "url": "https://api.github.com/repos/bellshade/Python/pulls/1",
+        "html_url": "https://github.com/bellshade/Python/pull/1",
+        "head": {"sha": head_sha},
+        "updated_at": updated_at,
+    }
+
+
+@pytest.mark.asyncio
+async def test_newer_head_cancels_running_review() -> None:
+    pipelines = ReviewPipelines()
+    started = asyncio.Event()
+
+    async def slow_review() -> None:
+        started.set()
+        await asyncio.sleep(10)
+
+    old = asyncio.ensure_future(
+        pipelines.run(pull_request("a" * 40, "2022-01-01T00:00:00Z"), slow_review())
+    )
+    await started.wait()
+    assert pipelines.cancel_superseded(pull_request("b" * 40, "2022-01-01T00:01:00Z"))
+    await asyncio.wait_for(old, 1)
+
+
+@pytest.mark.asyncio
+async def test_late_older_head_does_not_cancel_or_review() -> None:
+    pipelines = ReviewPipelines()
+    started = asyncio.Event()
+    reviewed: list[str] = []
+
+    async def review(head_sha: str) -> None:
+        started.set()
+        await asyncio.sleep(0.05)
+        reviewed.append(head_sha)
+
+    newer = pull_request("b" * 40, "2022-01-01T00:01:00Z")
+    older = pull_request("a" * 40, "2022-01-01T00:00:00Z")
+    running = asyncio.ensure_future(pipelines.run(newer, review("new")))
+    await started.wait()
+
+    assert not pipelines.cancel_superseded(older)
+    await pipelines.run(older, review("old"))
+    await running
+    assert reviewed == ["new"]
+    assert pipelines.is_latest(newer)
+    assert not pipelines.is_latest(older)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Optional
+
+import pytest
+from aiohttp import ClientSession
+
+from bellshadebot import tracing
+from bellshadebot.api import GitHubAPI, InstallationToken, InstallationTokenCache
+from bellshadebot.scheduler import TaskScheduler
+from bellshadebot.tracing import JsonFileExporter, Span, Tracer
+
+
+class RecordingExporter(JsonFileExporter):
+    def __init__(self) -> None:
+        super().__init__("")
+        self.payloads: list[dict[str, Any]] = []
+
+    def export(self, payload: dict[str, Any]) -> None:
+        self.payloads.append(payload)
+
+
+def span_names(payload: dict[str, Any]) -> list[str]:
+    return [
+        span["name"]
+        for resource in payload["resourceSpans"]
+        for scope in resource["scopeSpans"]
+        for span in scope["spans"]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduled_callback_does_not_join_exported_trace() -> None:
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter, sample_rate=1.0, sentry=False)
+    scheduler = TaskScheduler()
+    fired = asyncio.Event()
+    seen: list[Optional[Span]] = []
+
+    async def recheck() -> None:
+        with tracer.span("recheck") as span:
+            seen.append(span)
+        fired.set()
+
+    with tracer.trace("first", "delivery-1") as first:
+        with tracer.span("handler"):
+            scheduler.schedule("recheck", 0.05, recheck)
+    with tracer.trace("second", "delivery-2"):
+        pass
+    await asyncio.wait_for(fired.wait(), 1)
+    await scheduler.close()
+    tracer.close()
+
+    assert seen == [None]
+    assert first is not None
+    assert [span.name for span in first.trace.spans] == ["handler", "first"]
+    assert [span_names(payload) for payload in exporter.payloads] == [
+        ["handler", "first"],
+        ["second"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_token_refresh_runs_outside_delivery_trace() -> None:
+    tracer = Tracer(RecordingExporter(), sample_rate=1.0, sentry=False)
+    cache = InstallationTokenCache()
+    refreshed: asyncio.Future[tuple[GitHubAPI, Optional[Span]]] = (
+        asyncio.get_running_loop().create_future()
+    )
+
+    def refresh(gh: GitHubAPI, *args: Any) -> None:
+        refreshed.set_result((gh, tracing._current.get()))
+
+    cache._refresh_token = refresh  # type: ignore[assignment]
+    async with ClientSession() as session:
+        gh = GitHubAPI(1, session, "test")
+        gh._memo[("https://api.github.com/", "accept", None)] = (({}, None), None, None)
+        with tracer.trace("first", "delivery-1"):
+            cache._schedule_refresh(gh, 1, InstallationToken("token", time.time()))
+
+        refresh_gh, span = await asyncio.wait_for(refreshed, 1)
+    assert span is None
+    # timer refresh tidak boleh menahan respons yang di-memo delivery
+    assert refresh_gh is not gh
+    assert refresh_gh._memo == {}
+    cache.close()
+    tracer.close()